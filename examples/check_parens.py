@@ -15,6 +15,8 @@ container_symbols = ['(', ')', '[', ']', '{', '}']
 # Uncomment the next line to see a trace of the state machine.
 # @trace
 class ParenChecker(InputTape, PushDown):
+    # Frames only hold the position, so use slotted, pooled frames.
+    frame_fields = ('pos',)
 
     def __init__(self, stream):
         super().__init__(initial='scan', stream=stream)
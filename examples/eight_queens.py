@@ -15,8 +15,8 @@ from pycog.utility.diagram import diagram
 # The states are ordered pairs (row, col) for each of the 64 squares on the
 # board.  The state has two possible values: False if there is no queen on the
 # square, True otherwise.  When we enter a state we record the coordinates of
-# the associated square as a queen location.  When we backtrack we erase that
-# record.
+# the associated square as a queen location.  The record is kept in a
+# TrailedSet, so it is erased automatically when we backtrack.
 #
 # We could allow a transition from any square to any other one, but we'll use
 # the transitions we assign to each square limit the paths.  For any square
@@ -25,37 +25,12 @@ from pycog.utility.diagram import diagram
 # from any square, except for the ones in the last column, which all transition
 # to state "final".
 #
-# The transition tests will allow check for queen on the same diagonal or row
-# as the candidate square.  There is no need to check for a queen in the same
-# column because the choice of transitions precludes that possibility.
-
-def transition_test(fsm, cur_square, next_square):
-    """
-    Transition test
-
-    Check that the next square doesn't violate the "no queen attacking" rule by
-    looking at the rows and diagonals.  The transition strategy (see
-    EightQueens) makes checking columns unnecessary.
-    """
-    next_row, next_col = next_square
-
-    # check the row
-    for col in range(next_col):
-        if (next_row, col) in fsm.queens:
-            return False
-
-    # check the two diagonals so far, from (next_row, next_col)
-    diag_len = min(next_row, next_col)
-    for step in range(diag_len):
-        if (next_row - step - 1, next_col - step - 1) in fsm.queens:
-            return False
-
-    diag_len = min(7 - next_row, next_col)
-    for step in range(diag_len):
-        if (next_row + step + 1, next_col - step - 1) in fsm.queens:
-            return False
-
-    return True
+# Rather than test each candidate square against the queens placed so far, we
+# keep a domain for each column: the rows where a queen could still go.  When
+# a queen is placed, propagate() removes the squares it attacks from the
+# domains of the later columns, and backtracks at once if a column is left with
+# no possible rows.  There is no need to check for a queen in the same column
+# because the choice of transitions precludes that possibility.
 
 class EightQueens(Backtracking, StateMachine):
     """
@@ -67,16 +42,20 @@ class EightQueens(Backtracking, StateMachine):
         information we need.
 
     Transition Strategy:
-        'init' transitions to the first 4 rows of column 0.  We don't bother
-        transitioning to the last 4 rows because by symmetry if there is a
-        solution with a queen in the last 4 squares of the first column, then
-        one can flip the board to get a solution in the first 4 rows.
+        'init' transitions to the rows of column 0.  Reflecting the board top
+        to bottom is declared as a symmetry, so the search doesn't bother with
+        the last 4 rows: if there is a solution with a queen in the last 4
+        squares of the first column, then one can flip the board to get a
+        solution in the first 4 rows.
 
         Each square in any given column transitions to all the squares of the
         next column, except for the squares on the same row or diagonal.
 
         All squares of the last column transition to 'final'.
 
+        A square is only entered if its row is in the domain of its column,
+        see propagate().
+
     Attributes:
         queens: Set of (row, col) coordinates, each being the position of one
             of the eight queens.
@@ -85,7 +64,9 @@ class EightQueens(Backtracking, StateMachine):
     def __init__(self):
         super().__init__(initial='init')
 
-        self.queens = set()
+        self.queens = TrailedSet(self.trail)
+        for col in range(8):
+            self.domains.define(col, range(8))
 
         # Add states for each square
         for row in range(8):
@@ -95,7 +76,7 @@ class EightQueens(Backtracking, StateMachine):
         # Add transitions
         for row in range(8):
             # Transitions from 'init' and to 'final'.
-            if row < 4: self.add_transition('init', (row, 0))
+            self.add_transition('init', (row, 0))
             self.add_transition((row, 7), 'final')
 
             for col in range(7):
@@ -105,13 +86,43 @@ class EightQueens(Backtracking, StateMachine):
                     if next_row == row + 1: continue
                     if next_row == row - 1: continue
 
-                    self.add_transition((row, col), (next_row, col + 1),
-                                         transition_test)
+                    self.add_transition((row, col), (next_row, col + 1))
+
+        self.add_symmetry(EightQueens.reflect)
+
+    @staticmethod
+    def reflect(s_name):
+        """Reflect a square top to bottom."""
+        if s_name in ['init', 'final']:
+            return s_name
+        row, col = s_name
+        return 7 - row, col
 
     def place_queen(self):
         """In a square state, meaning we place a queen on this square."""
         self.queens.add(self.current_state)
 
+    def propagate(self):
+        """
+        Remove the squares attacked by a new queen from the later columns.
+        """
+        if self.current_state in ['init', 'final']:
+            return
+
+        row, col = self.current_state
+        for next_col in range(col + 1, 8):
+            offset = next_col - col
+            for next_row in (row - offset, row, row + offset):
+                if 0 <= next_row < 8:
+                    self.domains.remove(next_col, next_row)
+
+    def domain_key(self, s_name):
+        """Squares are the row values of the column decisions."""
+        if s_name in ['init', 'final']:
+            return None
+        row, col = s_name
+        return col, row
+
     @state("init")
     def init(self):
         """
@@ -141,7 +152,12 @@ class EightQueens(Backtracking, StateMachine):
             sys.stdout.write('\n')
 
     def on_backtrack(self, occ):
-        """Undo the placing of a queen in response to backtracking."""
+        """
+        Backtracking notification.
+
+        The queen placed in this state is removed by the trail once this
+        returns.
+        """
         super().on_backtrack(occ)
 
         # Uncomment these two lines to display the state of the board each time
@@ -149,9 +165,6 @@ class EightQueens(Backtracking, StateMachine):
         # print()
         # self.draw()
 
-        if occ.state not in ['init', 'final']:
-            self.queens.remove(self.current_state)
-
     def on_exhausted(self):
         """
         Handle the case where no solution can be found.
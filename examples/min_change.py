@@ -15,12 +15,12 @@ class MinimalChange(Backtracking, StateMachine):
 
         self.amount = amount
         self.accumulated = 0
-        self.fewest = self.amount
         self.num_coins = 0
         self.first_run = True
         self.greedy = 0
-        self.coins = {}
-        self.best_coins = {}
+        self.coins = TrailedDict(self.trail,
+                                 ((value, 0) for value
+                                  in sorted(coin_values, reverse=True)))
 
         def transition_test(value):
             def _transition_test(self, current_state, next_state):
@@ -34,7 +34,6 @@ class MinimalChange(Backtracking, StateMachine):
         # Create a state for each coin denomination
         values = []
         for value in sorted(coin_values, reverse=True):
-            self.coins[value] = 0
             values.append(value)
             self.add_state(value, activity=MinimalChange.in_coin_state)
 
@@ -53,13 +52,46 @@ class MinimalChange(Backtracking, StateMachine):
             values.pop()
 
     def in_coin_state(self):
-        self.num_coins += 1
+        # Changes through the trail are undone on backtracking.
+        self.trail.set(self, 'num_coins', self.num_coins + 1)
         self.coins[self.current_state] += 1
-        self.accumulated += self.current_state
-
-        # Short-circuit if we already have a solution with this many coins
-        if self.num_coins == self.fewest:
-            raise Backtrack()
+        self.trail.set(self, 'accumulated',
+                       self.accumulated + self.current_state)
+
+    @property
+    def fewest(self):
+        """The fewest coins found so far, now read-only."""
+        if self.incumbent_value == None:
+            return self.amount
+        return self.incumbent_value
+
+    @property
+    def best_coins(self):
+        """The coin counts of the best solution found so far."""
+        if self.incumbent == None:
+            return {}
+        return self.incumbent
+
+    def objective(self):
+        return self.num_coins
+
+    def lower_bound(self, s_name):
+        if s_name == 'final':
+            return self.num_coins
+
+        # Coins are added in decreasing order, so the rest of the amount
+        # needs at least this many more coins.
+        remaining = self.amount - self.accumulated
+        return self.num_coins - (-remaining // s_name)
+
+    def solution(self):
+        return dict(self.coins)
+
+    def signature(self):
+        # Coins are added in decreasing order, so the rest of the search
+        # depends only on the last coin, the amount so far and the number of
+        # coins.
+        return (self.current_state, self.accumulated, self.num_coins)
 
     @state('init')
     def init(self):
@@ -67,24 +99,11 @@ class MinimalChange(Backtracking, StateMachine):
 
     @state('final')
     def final(self):
-        if self.num_coins < self.fewest:
-            self.fewest = self.num_coins
-            self.best_coins = dict((k,v) for (k,v) in self.coins.items())
-
         if self.first_run:
             self.greedy = self.num_coins
             self.first_run = False
 
-        raise Backtrack()
-
-    def on_backtrack(self, occ):
-        super().on_backtrack(occ)
-
-        if occ.state not in ['init', 'final']:
-            # This works because coin states are integers
-            self.accumulated -= self.current_state
-            self.num_coins -= 1
-            self.coins[self.current_state] -= 1
+        raise Accept()
 
 if __name__ == "__main__":
     fsm = MinimalChange(35, [1, 3, 5, 7, 11, 13])
@@ -7,6 +7,7 @@ if __name__ == '__main__':
 
 from pycog.statemachine import state
 from pycog.pushdown import *
+from pycog.inputtape import InputTape
 from pycog.utility.trace import trace
 from pycog.utility.treedump import treedump
 from pycog.exceptions import Reject, Accept, StateStackEmpty
@@ -60,7 +61,7 @@ class SimpleExprNode:
 
 # Uncomment the next line to see a trace of the state machine.
 #@trace
-class ParseSimpleExpr(PushDown):
+class ParseSimpleExpr(InputTape, PushDown):
     """
     Create a tree from an expression.
 
@@ -70,13 +71,13 @@ class ParseSimpleExpr(PushDown):
         (Whitespace is allowed anywhere except in an id)
 
         "a( b2, c (_, d))" is a valid expression.
+
+    Any input tape will do, e.g. mix in IterableTape instead of InputTape to
+    parse the characters of a string or the output of a generator.
     """
 
     def __init__(self, stream, graph):
-        super().__init__(initial='scan')
-
-        self.stream = stream
-        self._symbol = self.stream.read(1)
+        super().__init__(initial='scan', stream=stream)
 
         # Record the symbol position in the stack frame for better error
         # reporting.
@@ -84,8 +85,6 @@ class ParseSimpleExpr(PushDown):
 
         self.error_msg = ''
 
-        self.pos = 0
-
         self.open_symbol_pos = None
         self.close_symbol_pos = None
 
@@ -106,17 +105,6 @@ class ParseSimpleExpr(PushDown):
         self.active_frame.pos = self.pos
         self.active_frame.node = self.node
 
-    @property
-    def symbol(self):
-        """Return the current symbol"""
-        return self._symbol
-
-    def advance(self):
-        """Advance the stream position"""
-        self._symbol = self.stream.read(1)
-        self.pos += 1
-        return self._symbol
-
     def unmatched_open(self):
         self.open_symbol_pos = self.top_frame.pos - 1
 
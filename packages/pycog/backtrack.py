@@ -1,6 +1,9 @@
 """Support for back-tracking in state machines"""
 
 import itertools
+import time
+from collections import Counter, OrderedDict, deque
+from collections.abc import MutableMapping, MutableSet, Sequence
 from pycog.statemachine import StateMachine
 from pycog.exceptions import Accept, Reject, Backtrack
 
@@ -9,7 +12,282 @@ def _track_format(occ):
     Format one StateOccurrence in a Track as an arrow.
     """
     arrow = ' -({n})-> '
-    return str(occ.state_name), arrow.format(n=len(occ.transitions)+1)
+    return str(occ.state), arrow.format(n=occ.remaining + 1)
+
+class Trail:
+    """
+    Undo log for application data changed during a backtracking search.
+
+    Each change made through the trail records how to undo it.  A mark is the
+    position in the log, and undo_to(mark) reverts every change made since the
+    mark was taken, most recent first.
+
+    Backtracking takes a mark as each state is entered, and undoes to it when
+    the occurrence is backtracked, so changes made through the trail need no
+    on_backtrack() handler.
+    """
+    def __init__(self):
+        self._entries = []
+
+        # Number of entries forgotten from the start of the log.
+        self._base = 0
+
+    def mark(self):
+        """Return a mark for the current position in the log."""
+        return self._base + len(self._entries)
+
+    def push(self, undo, *args):
+        """
+        Record an arbitrary change.
+
+        Args:
+            undo: Callable reverting the change, called as undo(*args).
+        """
+        self._entries.append((undo, args))
+
+    def set(self, obj, attr, value):
+        """
+        Set an attribute, recording its old value.
+
+        Equivalent to setattr(obj, attr, value), except that it is undone on
+        backtracking.
+        """
+        if hasattr(obj, attr):
+            self._entries.append((setattr, (obj, attr, getattr(obj, attr))))
+        else:
+            self._entries.append((delattr, (obj, attr)))
+        setattr(obj, attr, value)
+
+    def undo_to(self, mark):
+        """Undo the changes recorded since the mark was taken."""
+        entries = self._entries
+        keep = mark - self._base
+        assert keep >= 0, "Mark has been forgotten."
+        while len(entries) > keep:
+            undo, args = entries.pop()
+            undo(*args)
+
+    def forget_to(self, mark):
+        """
+        Forget the changes recorded before the mark was taken.
+
+        They can no longer be undone, so this is for when there is no
+        backtracking past the mark.
+        """
+        drop = mark - self._base
+        if drop > 0:
+            del self._entries[:drop]
+            self._base = mark
+
+    def __len__(self):
+        return len(self._entries)
+
+class TrailedSet(MutableSet):
+    """
+    Set whose changes are recorded on a Trail.
+    """
+    def __init__(self, trail, iterable=()):
+        self.trail = trail
+        self._items = set(iterable)
+
+    def add(self, item):
+        if item not in self._items:
+            self._items.add(item)
+            self.trail.push(self._items.discard, item)
+
+    def discard(self, item):
+        if item in self._items:
+            self._items.remove(item)
+            self.trail.push(self._items.add, item)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self._items)
+
+class TrailedDict(MutableMapping):
+    """
+    Dictionary whose changes are recorded on a Trail.
+    """
+    def __init__(self, trail, *args, **kw_args):
+        self.trail = trail
+        self._items = dict(*args, **kw_args)
+
+    def __setitem__(self, key, value):
+        items = self._items
+        if key in items:
+            self.trail.push(items.__setitem__, key, items[key])
+        else:
+            self.trail.push(items.__delitem__, key)
+        items[key] = value
+
+    def __delitem__(self, key):
+        items = self._items
+        self.trail.push(items.__setitem__, key, items[key])
+        del items[key]
+
+    def __getitem__(self, key):
+        return self._items[key]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self._items)
+
+class Domains:
+    """
+    Trailed domains of the decisions still to be made in a search.
+
+    Each key names a decision point, e.g. a column of the chess board in the
+    eight queens problem, and its domain is the TrailedSet of values still
+    possible for it, e.g. the rows.  Propagation removes values, and the
+    removals are undone on backtracking like any other trailed change.
+    """
+    def __init__(self, trail):
+        self.trail = trail
+        self._domains = {}
+
+    def define(self, key, values):
+        """
+        Define the initial domain of a decision point.
+
+        This is not trailed, so it is meant for setting up the search.
+        """
+        self._domains[key] = TrailedSet(self.trail, values)
+
+    def allows(self, key, value):
+        """
+        Test whether a value is still possible for a decision point.
+
+        Decision points without a domain allow any value.
+        """
+        domain = self._domains.get(key)
+        return domain == None or value in domain
+
+    def remove(self, key, value):
+        """
+        Remove a value from the domain of a decision point.
+
+        Raises:
+            Backtrack: The domain is now empty, so the decision point can't be
+                satisfied.
+        """
+        domain = self._domains[key]
+        domain.discard(value)
+        if len(domain) == 0:
+            raise Backtrack()
+
+    def __getitem__(self, key):
+        return self._domains[key]
+
+    def __contains__(self, key):
+        return key in self._domains
+
+    def __iter__(self):
+        return iter(self._domains)
+
+    def __len__(self):
+        return len(self._domains)
+
+class SearchStats:
+    """
+    Counters describing where the effort of a backtracking search goes.
+
+    Attributes:
+        nodes: Number of states entered.
+        backtracks: Number of occurrences backtracked.
+        max_depth: Greatest length of the track.
+        depth_total: Sum of the track length as each state was entered.
+        dead_ends: Counter of the states where the search had to backtrack.
+        fan_out: Counter of the number of candidate transitions selected from,
+            i.e. a histogram of the branching factor.
+        samples: Values of sample() taken while the search ran, see
+            Backtracking.on_stats().
+    """
+    def __init__(self):
+        self.nodes = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        self.depth_total = 0
+        self.dead_ends = Counter()
+        self.fan_out = Counter()
+        self.samples = []
+        self.start_time = time.perf_counter()
+
+    @property
+    def mean_depth(self):
+        """
+        Return the mean length of the track as states were entered.
+        """
+        if self.nodes == 0:
+            return 0.0
+        return self.depth_total/self.nodes
+
+    def sample(self):
+        """
+        Return a dictionary of the current totals and the elapsed time.
+        """
+        return {'elapsed': time.perf_counter() - self.start_time,
+                'nodes': self.nodes,
+                'backtracks': self.backtracks,
+                'max_depth': self.max_depth,
+                'mean_depth': self.mean_depth}
+
+    def __str__(self):
+        lines = ['nodes: {}'.format(self.nodes),
+                 'backtracks: {}'.format(self.backtracks),
+                 'depth: max {}, mean {:.1f}'.format(self.max_depth,
+                                                     self.mean_depth)]
+
+        fan_out = ', '.join('{}: {}'.format(width, count)
+                            for width, count in sorted(self.fan_out.items()))
+        lines.append('fan-out: ' + fan_out)
+
+        dead_ends = ', '.join('{}: {}'.format(s_name, count) for s_name, count
+                              in self.dead_ends.most_common(5))
+        lines.append('dead ends: ' + dead_ends)
+        return '\n'.join(lines)
+
+class _Remaining(Sequence):
+    """
+    Live view of the transitions of a StateOccurrence not yet taken.
+
+    Creating the view copies nothing; slicing it does.
+    """
+    __slots__ = ('occurrence',)
+
+    def __init__(self, occurrence):
+        self.occurrence = occurrence
+
+    def __len__(self):
+        return self.occurrence.remaining
+
+    def __getitem__(self, index):
+        occ = self.occurrence
+        if isinstance(index, slice):
+            return tuple(occ.candidates[occ.cursor:][index])
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+        return occ.candidates[occ.cursor + index]
+
+    def __eq__(self, other):
+        return isinstance(other, Sequence) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return repr(tuple(self))
 
 class StateOccurrence:
     """
@@ -20,22 +298,79 @@ class StateOccurrence:
         (state 1) -> (state 2) -> (state 1)
 
     then there are two occurrences of (state 1) and one of (state 2).
+
+    The candidate transitions are held in a list, and taking a transition
+    moves it to the cursor and advances the cursor past it, so the
+    transitions not yet taken are never copied.
     """
     def __init__(self, state):
         self.state = state
-        self.transitions = []
+        self.candidates = ()
+        self.cursor = 0
+
+        # Input tape mark at the time the transitions were selected, if the
+        # state machine has a rewindable input tape.
+        self.tape_mark = None
+
+        # Search signature after the state's activity, if any.
+        self.signature = None
+
+        # Trail mark at the time the state was entered.
+        self.trail_mark = None
+
+        # Stack mark at the time the transitions were selected, if the state
+        # machine is a pushdown automaton.
+        self.stack_mark = None
+
+        # The symmetries mapping every state of the path to itself.
+        self.symmetries = ()
+
+        # True if cut() discarded transitions not yet taken.
+        self.committed = False
+
+        # True if a solution was generated in the occurrence's subtree, or
+        # the subtree was set aside, so it isn't known to fail.
+        self.found = False
+
+    @property
+    def transitions(self):
+        """
+        Return a live view of the transitions not yet taken.
+
+        The view is a sequence, and doesn't copy the candidates.
+        """
+        return _Remaining(self)
+
+    @property
+    def remaining(self):
+        """
+        Return the number of transitions not yet taken.
+        """
+        return len(self.candidates) - self.cursor
 
     def set_transitions(self, transitions):
         """
-        Set the list of transitions for this occurrence.
+        Set the candidate transitions for this occurrence.
         """
-        self.transitions = transitions
+        self.candidates = list(transitions)
+        self.cursor = 0
 
     def remove_transition(self, transition):
         """
-        Remove one transition from the occurrence's transition list.
+        Remove one transition from the occurrence's transitions.
+
+        This is O(1) when the transition is the next candidate, which it is
+        unless select_transition() is overridden to choose another.  Otherwise
+        the candidates before it are shifted along in place, keeping their
+        order.
         """
-        self.transitions.remove(transition)
+        candidates = self.candidates
+        cursor = self.cursor
+        if candidates[cursor] != transition:
+            index = candidates.index(transition, cursor)
+            candidates[cursor + 1:index + 1] = candidates[cursor:index]
+            candidates[cursor] = transition
+        self.cursor = cursor + 1
 
 
 class Track:
@@ -43,21 +378,29 @@ class Track:
     Sequence of states visited by the state machine.
 
     This is a stack of StateOccurrence objects, with a bound on its depth.
+    When the bound is reached the oldest occurrence is dropped as each new one
+    is appended, which is O(1).
     """
     def __init__(self, max_occ=-1):
-        self.occurrences = []
+        if max_occ < 0:
+            self.occurrences = deque()
+        else:
+            self.occurrences = deque(maxlen=max_occ)
         self.max_occ = max_occ
 
     def append(self, occ):
         """
         Append an occurrence to this track.
+
+        Returns:
+            A sequence of the occurrences dropped to keep within max_occ.
         """
-        self.occurrences.append(occ)
-        if self.max_occ < 0:
-            return
-        track_len = len(self.occurrences)
-        if track_len > self.max_occ:
-            del self.occurrences[0:track_len - self.max_occ]
+        occurrences = self.occurrences
+        dropped = ()
+        if occurrences and len(occurrences) == occurrences.maxlen:
+            dropped = (occurrences[0],)
+        occurrences.append(occ)
+        return dropped
 
     def last(self):
         """
@@ -83,10 +426,87 @@ class Track:
 class Backtracking:
     """
     Mix-in to implement backtracking in a state machine.
+
+    Application data changed through self.trail, or kept in TrailedSet and
+    TrailedDict objects on it, is restored automatically on backtracking.
+    Other application data must be restored by an on_backtrack() handler.
+
+    If the state machine also has a rewindable input tape (one with mark(),
+    reset_to() and release(), such as InputTape), each occurrence records the
+    tape position when its transitions are selected, and backtracking rewinds
+    the tape to it.  Likewise the frame stack of a PushDown state machine is
+    restored when backtracking.
+
+    Overriding signature() enables a transposition table: signatures of
+    occurrences whose transitions have all been exhausted without generating
+    a solution are remembered, and any later occurrence with a remembered
+    signature is backtracked as soon as its activity completes.  At most
+    memo_size signatures are remembered, the least recently used being
+    forgotten first.  A negative memo_size means no limit.
+
+    Backtracking is driven by loops over the track rather than by recursion,
+    so the depth of the search is limited by memory, not by the recursion
+    limit.
+
+    run() stops at the first accepted configuration.  solutions() instead
+    generates each accepted configuration's solution(), backtracking to search
+    for the next one only when it is asked for.  run_all() passes each of them
+    to a callback.
+
+    Overriding objective() turns the search into branch-and-bound
+    minimization.  Accepted configurations no longer stop the search: the
+    best one so far is kept as the incumbent, and the search continues until
+    it is exhausted, when run() accepts if there is an incumbent.  The state
+    machine has then been unwound, so the result is the incumbent, not
+    solution().  Once there is an incumbent, lower_bound() is asked for a
+    bound on each candidate transition, and candidates that cannot beat the
+    incumbent are pruned before they are entered.
+
+    Forward checking is supported through self.domains, a Domains object.
+    propagate() is called after each state's activity, to remove the values
+    the new state rules out from the domains of the decisions to come, and
+    domain_key() maps candidate transitions to domain values, so candidates
+    whose values have been removed are never tried.
+
+    Symmetries of the search are declared with add_symmetry(), as
+    permutations of the states, and add_signature_symmetry(), as permutations
+    of signatures.  Branches mapped by a symmetry to branches already explored
+    are pruned.
+
+    Search statistics are kept in self.stats, a SearchStats object.  If
+    stats_interval is set, on_stats() is called each time that many more
+    states have been entered.
     """
-    def __init__(self, max_occ=-1, **kw_args):
+    def __init__(self, max_occ=-1, memo_size=65536, stats_interval=None,
+                 **kw_args):
         super().__init__(**kw_args)
         self.track = Track(max_occ)
+        self.trail = Trail()
+        self.domains = Domains(self.trail)
+        self.stats = SearchStats()
+        self.stats_interval = stats_interval
+
+        # Signatures of exhausted occurrences, least recently used first.
+        self.memo_size = memo_size
+        self._exhausted_signatures = OrderedDict()
+
+        # States the path must start with, see restrict_path().
+        self._path_prefix = None
+
+        # Paths set aside at the depth limit, see restrict_depth().
+        self._depth_limit = None
+        self.set_aside = []
+
+        # True while solutions() is generating accepted configurations.
+        self._enumerating = False
+
+        # Best solution found so far by branch-and-bound, see objective().
+        self.incumbent = None
+        self.incumbent_value = None
+
+        # Declared symmetries, see add_symmetry().
+        self._symmetries = []
+        self._signature_symmetries = []
 
         if __debug__:
             mro = type(self).mro()
@@ -103,14 +523,45 @@ class Backtracking:
         """
         Handle on_enter notifications for backtracking.
         """
-        if __debug__:
-            if '_push_state' in self.state_dict(s_name):
-                raise TypeError("Class 'Backtracking' does not yet support "\
-                                "push and pop states.")
+        occ = self.make_occurrence()
+        occ.trail_mark = self.trail.mark()
+        if self._symmetries:
+            if self.track.occurrences:
+                symmetries = self.track.last().symmetries
+            else:
+                symmetries = self._symmetries
+            occ.symmetries = tuple(perm for perm in symmetries
+                                   if perm(s_name) == s_name)
+        dropped = self.track.append(occ)
+        for occ in dropped:
+            self._release_tape_mark(occ)
+        if dropped:
+            # There is no backtracking to the dropped occurrences.
+            self.trail.forget_to(self.track.occurrences[0].trail_mark)
+
+        stats = self.stats
+        stats.nodes += 1
+        depth = len(self.track)
+        stats.depth_total += depth
+        if depth > stats.max_depth:
+            stats.max_depth = depth
+        if self.stats_interval and stats.nodes % self.stats_interval == 0:
+            self.on_stats(stats)
 
-        self.track.append(self.make_occurrence())
         super().on_enter_state(s_name)
 
+    def on_stats(self, stats):
+        """
+        Periodic search statistics notification.
+
+        Called each time stats_interval more states have been entered.  The
+        default appends stats.sample() to stats.samples.
+
+        Args:
+            stats: The SearchStats of this state machine.
+        """
+        stats.samples.append(stats.sample())
+
     def make_occurrence(self):
         """
         Create an occurrence from the current state.
@@ -119,11 +570,190 @@ class Backtracking:
         """
         return StateOccurrence(self.current_state)
 
+    def signature(self):
+        """
+        Return a hashable summary of the search state, or None.
+
+        Called after the activity of each state.  Two occurrences with equal
+        signatures must have identical outcomes: the same states reachable,
+        with the same effects on the application data.  Typically this means
+        the current state plus whatever application data transition tests and
+        activities depend on.
+
+        The default returns None, which disables the transposition table.
+        """
+        return None
+
+    def objective(self):
+        """
+        Return the value of the current (accepted) configuration, or None.
+
+        Lower values are better.  The default returns None, which disables
+        branch-and-bound.
+        """
+        return None
+
+    def lower_bound(self, s_name):
+        """
+        Return a lower bound on the objective of solutions through a state.
+
+        Called when s_name is a candidate transition from the current state,
+        before it is entered, and only once there is an incumbent.  The bound
+        must not exceed the objective() of any accepted configuration reached
+        by entering s_name now.
+
+        The default returns None, meaning no bound is known, so nothing is
+        pruned.
+        """
+        return None
+
+    def _bounded(self, transitions):
+        """
+        Drop the transitions whose lower bound cannot beat the incumbent.
+
+        Returns:
+            transitions itself if none are dropped, else a new list.
+        """
+        best = self.incumbent_value
+        if best == None:
+            return transitions
+
+        bounded = None
+        for i, s_name in enumerate(transitions):
+            bound = self.lower_bound(s_name)
+            if bound == None or bound < best:
+                if bounded != None:
+                    bounded.append(s_name)
+            elif bounded == None:
+                bounded = list(transitions[:i])
+        if bounded == None:
+            return transitions
+        return bounded
+
+    def propagate(self):
+        """
+        Propagate the consequences of entering the current state.
+
+        Called after the state's activity.  Remove the values ruled out by the
+        state from self.domains; Domains.remove() raises Backtrack as soon as a
+        domain is empty.  Changes to self.domains are undone on backtracking.
+
+        The default does nothing.
+        """
+        pass
+
+    def domain_key(self, s_name):
+        """
+        Return the (key, value) pair a candidate transition corresponds to.
+
+        A candidate transition to s_name is only taken if
+        self.domains.allows(key, value).  Return None for states that aren't
+        constrained by the domains, which is the default.
+        """
+        return None
+
+    def _in_domain(self, transitions):
+        """
+        Drop the transitions whose values have been removed from the domains.
+        """
+        if len(self.domains) == 0:
+            return transitions
+
+        kept = []
+        for s_name in transitions:
+            key_value = self.domain_key(s_name)
+            if key_value == None or self.domains.allows(*key_value):
+                kept.append(s_name)
+        return kept
+
+    def add_symmetry(self, perm):
+        """
+        Declare a symmetry of the search, as a permutation of the states.
+
+        perm(s_name) returns the state symmetric to s_name.  It must map every
+        path of the search to a path with the same outcome, e.g. reflecting
+        the board in the eight queens problem.  Declare every element of the
+        symmetry group other than the identity, since they aren't composed.
+
+        A candidate transition is pruned when a symmetry maps every state of
+        the path so far to itself, and maps the candidate to an earlier
+        candidate of the same state.  The earlier candidate's subtree is the
+        image of the pruned one, so only the lexicographic leader among
+        symmetric paths is searched.
+        """
+        self._symmetries.append(perm)
+
+    def add_signature_symmetry(self, perm):
+        """
+        Declare a symmetry of the search, as a permutation of signatures.
+
+        perm(signature) returns the symmetric signature.  An occurrence is
+        pruned if its signature or the image of it under any declared
+        symmetry is known to be exhausted, so the transposition table is
+        effectively keyed by the symmetry class of each signature.  Declare
+        every element of the symmetry group other than the identity.
+        """
+        self._signature_symmetries.append(perm)
+
+    def _asymmetric(self, transitions):
+        """
+        Drop the transitions symmetric to earlier ones.
+        """
+        if len(self.track) == 0:
+            return transitions
+        symmetries = self.track.last().symmetries
+        if len(symmetries) == 0:
+            return transitions
+
+        order = dict((s_name, index)
+                     for index, s_name in enumerate(transitions))
+        kept = []
+        for index, s_name in enumerate(transitions):
+            for perm in symmetries:
+                if order.get(perm(s_name), index) < index:
+                    break
+            else:
+                kept.append(s_name)
+        return kept
+
+    def _do_activity(self):
+        """
+        Run the activity and propagate it, then prune the occurrence if its
+        signature, or a symmetric one, is known to be exhausted.
+        """
+        super()._do_activity()
+        self.propagate()
+
+        sig = self.signature()
+        if sig == None:
+            return
+        exhausted = self._exhausted_signatures
+        for key in itertools.chain((sig,), (perm(sig) for perm
+                                            in self._signature_symmetries)):
+            if key in exhausted:
+                exhausted.move_to_end(key)
+                raise Backtrack()
+        self.track.last().signature = sig
+
+    def _remember_exhausted(self, occ):
+        """
+        Add the signature of an occurrence proven to fail to the memo.
+        """
+        if occ.signature == None or occ.committed or occ.found:
+            return
+        self._exhausted_signatures[occ.signature] = True
+        if 0 <= self.memo_size < len(self._exhausted_signatures):
+            self._exhausted_signatures.popitem(last=False)
+
     def _backtrack(self):
         """
         Backtrack, reentering the state after the most recent unexplored
         transition.
 
+        This is a loop over the track, not a recursion, however many
+        occurrences are exhausted.  A Backtrack raised while reentering is
+        handled by the same loop.
+
         Returns:
             True if an alternate path was found, False is all paths are
             exhausted.
@@ -132,20 +762,265 @@ class Backtracking:
         super()._exit()
         # Find the latest occurrence that doesn't have an empty transition
         # stack.
-        for occ in reversed(self.track.occurrences):
-            if len(occ.transitions) > 0:
-                self.current_state = occ.state
+        occurrences = self.track.occurrences
+        while occurrences:
+            occ = occurrences[-1]
+            self.current_state = occ.state
+
+            if self._resume_transitions(occ):
+                if occ.tape_mark != None:
+                    self.reset_to(occ.tape_mark)
+                if occ.stack_mark != None:
+                    self.reset_stack(occ.stack_mark)
 
-                super()._transition_multiple(occ.transitions)
+                remaining = occ.remaining
+                try:
+                    super()._transition_multiple(occ.transitions)
+                except Backtrack:
+                    if occurrences[-1] is occ and occ.remaining == remaining:
+                        # Refused before any transition was taken.
+                        occ.set_transitions(())
+                    continue
 
                 return True
             else:
-                self.current_state = occ.state
-                self.on_backtrack(occ)
-                self.track.occurrences.pop()
+                self._pop_occurrence()
+
+        return False
+
+    def _resume_transitions(self, occ):
+        """
+        Prune the transitions to try when resuming an occurrence.
+
+        The occurrence's candidates are only replaced if some are dropped.
+        Search strategies may override this to restrict them further.
+
+        Returns:
+            True if the occurrence has transitions left to take.
+        """
+        # The incumbent may have improved since the transitions were selected.
+        if self.incumbent_value != None:
+            transitions = occ.transitions
+            bounded = self._bounded(transitions)
+            if bounded is not transitions:
+                occ.set_transitions(bounded)
+        return occ.remaining > 0
 
+    def _pop_occurrence(self, exhausted=True):
+        """
+        Backtrack the last occurrence of the track.
+
+        Args:
+            exhausted: False if the occurrence's transitions weren't all
+                explored, so its signature must not be remembered.
+        """
+        occ = self.track.last()
+        self.current_state = occ.state
+        self.stats.backtracks += 1
+        self.on_backtrack(occ)
+        self.trail.undo_to(occ.trail_mark)
+        self._release_tape_mark(occ)
+        if exhausted:
+            self._remember_exhausted(occ)
+        self.track.occurrences.pop()
+        if occ.found and self.track.occurrences:
+            self.track.last().found = True
+
+    def _unwind(self, depth):
+        """
+        Backtrack occurrences, unexplored transitions or not, until the track
+        holds depth of them.
+        """
+        while len(self.track) > depth:
+            self._pop_occurrence(exhausted=False)
+
+    def _release_tape_mark(self, occ):
+        """Release the input tape mark held by an occurrence, if any."""
+        if occ.tape_mark != None:
+            self.release(occ.tape_mark)
+            occ.tape_mark = None
+
+    def _continue_search(self):
+        """
+        Backtrack after a dead end, rejecting if the search is exhausted.
+
+        An exhausted branch-and-bound search accepts instead, if it found an
+        incumbent.  A bound set from elsewhere, e.g. by parallel_search(),
+        doesn't count.
+        """
+        if not self._backtrack():
+            # Exhaustion is how solutions() normally ends.
+            if not self._enumerating:
+                self.on_exhausted()
+                if self.incumbent != None:
+                    raise Accept()
+
+            raise Reject("Backtracking exhausted.")
+
+    def cut(self, occ):
+        """
+        Commit to the path taken since an occurrence.
+
+        The transitions not yet taken by the occurrence and every later one on
+        the track are discarded, so backtracking passes straight back over
+        them, as with a cut in Prolog.
+
+        Args:
+            occ: A StateOccurrence on the track.
+        """
+        for later in reversed(self.track.occurrences):
+            if later.remaining > 0:
+                later.set_transitions(())
+                later.committed = True
+            if later is occ:
+                break
+
+    def restrict_path(self, prefix):
+        """
+        Only search paths starting with the given states.
+
+        No alternatives are tried for the transitions in the prefix, so the
+        search covers just the subtree below it.  This requires an unbounded
+        track (max_occ < 0).
+
+        Args:
+            prefix: Sequence of state names, starting with the initial state.
+        """
+        assert self.track.max_occ < 0, "Path restriction needs the full track."
+        self._path_prefix = tuple(prefix)
+
+    def restrict_depth(self, depth):
+        """
+        Set aside the paths of depth transitions instead of searching below.
+
+        Each path set aside is appended to set_aside, as a tuple of state
+        names that can be passed to restrict_path().  The subtrees set aside
+        aren't known to fail, so they don't prune later occurrences with the
+        same signature.
+
+        Args:
+            depth: The number of transitions in the paths set aside.
+        """
+        self._depth_limit = depth
+
+    def solution(self):
+        """
+        Return a description of the current (accepted) configuration.
+
+        The default is a tuple of the states in the track.  Override this to
+        return application data instead, e.g. the positions of the queens for
+        the eight queens problem.
+        """
+        return tuple(occ.state for occ in self.track)
+
+    def solutions(self):
+        """
+        Run the state machine, generating every accepted configuration.
+
+        Each time a configuration is accepted its solution() is yielded, and
+        the search is suspended until the next solution is asked for.  While
+        suspended the state machine is still in the accepted configuration, so
+        its track and application data can be examined.  The search ends when
+        it is exhausted.  Since that is the normal end of solutions(),
+        on_exhausted() is not called.
+
+        With branch-and-bound only configurations improving on the incumbent
+        are generated.
+
+        Yields:
+            The value of solution() for each accepted configuration.
+        """
+        assert self._current_state, "Initial state not set."
+
+        self._enumerating = True
+        try:
+            self._enter()
+            while True:
+                try:
+                    self._step()
+                except Accept:
+                    if self.track.occurrences:
+                        # The path to a solution must not be memoized as
+                        # failing.
+                        self.track.last().found = True
+                    yield self.solution()
+                    self._continue_search()
+
+        except Reject as exc:
+            self._exit()
+            self.on_reject(exc)
+        finally:
+            self._enumerating = False
+
+    def run_all(self, callback):
+        """
+        Run the state machine, reporting every accepted configuration.
+
+        Calls callback(solution) for each solution generated by solutions().
+
+        Returns:
+            False, since the search ends when it is exhausted.
+        """
+        for solution in self.solutions():
+            callback(solution)
         return False
 
+    def _step(self):
+        """
+        Take a step, backtracking when a Backtrack exception is raised, and
+        updating the incumbent of a branch-and-bound search.
+
+        Accept is only raised to the caller when the search should stop, or
+        when solutions() should report the accepted configuration.
+        """
+        try:
+            super()._step()
+        except Backtrack:
+            self.stats.dead_ends[self.current_state] += 1
+            self._continue_search()
+        except Accept:
+            if len(self.track) == 0:
+                # An exhausted branch-and-bound search, accepting its
+                # incumbent.
+                raise
+
+            value = self.objective()
+            if value == None:
+                raise
+
+            if self.incumbent_value != None and self.incumbent_value <= value:
+                self._continue_search()
+                return
+            self.incumbent = self.solution()
+            self.incumbent_value = value
+
+            if self._enumerating:
+                raise
+            self._continue_search()
+
+    def _transition_multiple(self, allowed_transitions):
+        """
+        Transition, keeping to the paths set by restrict_path() and
+        restrict_depth(), and pruning transitions ruled out by the domains,
+        symmetric to earlier ones, or unable to beat the incumbent.
+        """
+        if self._depth_limit != None and len(self.track) > self._depth_limit:
+            self.set_aside.append(tuple(occ.state for occ in self.track))
+            self.track.last().found = True
+            raise Backtrack()
+
+        prefix = self._path_prefix
+        if prefix != None and len(self.track) < len(prefix):
+            next_state = prefix[len(self.track)]
+            allowed_transitions = [s_name for s_name in allowed_transitions
+                                   if s_name == next_state]
+
+        allowed_transitions = self._in_domain(allowed_transitions)
+        allowed_transitions = self._asymmetric(allowed_transitions)
+        allowed_transitions = self._bounded(allowed_transitions)
+        self.stats.fan_out[len(allowed_transitions)] += 1
+        super()._transition_multiple(allowed_transitions)
+
     def on_transition(self, exiting, entering):
         """
         Notification that a transition is in effect.
@@ -156,14 +1031,15 @@ class Backtracking:
         super().on_transition(exiting, entering)
 
     def on_no_transition(self, s_name):
+        """
+        Handle a dead end, accepting if the state is accepting.
+
+        The Backtrack raised otherwise unwinds to _step(), which backtracks,
+        so dead ends don't nest calls.
+        """
         if self.accepting:
             raise Accept()
-        if self._backtrack():
-            return
-        else:
-            self.on_exhausted()
-
-            raise Reject("Backtracking exhausted.")
+        raise Backtrack()
 
     def on_exhausted(self):
         """
@@ -181,7 +1057,9 @@ class Backtracking:
         Backtrack notification handler.
 
         The specified StateOccurrence has been backtracked, and is about to be
-        deleted.  This provides a chance to synchronize application data.
+        deleted.  This provides a chance to synchronize application data not
+        kept on the trail.  The trail is undone to the occurrence's mark after
+        this handler returns.
 
         If you overload this method, be sure to call super().on_backtrack().
         """
@@ -191,10 +1069,16 @@ class Backtracking:
         """
         Handle pre_select_transition notifications.
 
-        Captures the allowed transitions for backtracking.
+        Captures the allowed transitions for backtracking, unless they are
+        the view of an occurrence being resumed.
         """
         occ = self.track.last()
-        occ.set_transitions(allowed_transitions)
+        if getattr(allowed_transitions, 'occurrence', None) is not occ:
+            occ.set_transitions(allowed_transitions)
+        if occ.tape_mark == None and hasattr(self, 'reset_to'):
+            occ.tape_mark = self.mark()
+        if hasattr(self, 'reset_stack'):
+            occ.stack_mark = self.mark_stack()
 
         super().on_pre_select_transition(s_name, allowed_transitions)
 
@@ -30,3 +30,19 @@ class StateStackEmpty(Exception):
         else:
             super().__init__(msg)
 
+
+class StackOverflow(Reject):
+    """
+    Reject the input because the state stack is too deep.
+    """
+    def __init__(self, msg=None):
+        if msg == None:
+            super().__init__("State stack is too deep.")
+        else:
+            super().__init__(msg)
+
+class GrammarError(Exception):
+    """
+    A grammar can't be read, or can't be compiled.
+    """
+    pass
@@ -0,0 +1,218 @@
+"""Pushdown automata following every transition at once"""
+
+import heapq
+import itertools
+
+from pycog.pushdown import PushDown
+from pycog.exceptions import Accept, Reject, Backtrack
+
+
+class _StackNode:
+    """
+    A node of the graph-structured stack.
+
+    A node stands for a push state suspended at an input position, and links
+    to each node that was on top of the stack when it was pushed.  None in
+    below is the bottom of the stack.
+    """
+    __slots__ = ('s_name', 'pos', 'below', 'pops')
+
+    def __init__(self, s_name, pos):
+        self.s_name = s_name
+        self.pos = pos
+
+        # Nodes below this one, as an ordered set.
+        self.below = dict()
+
+        # Input positions at which the node has been popped.
+        self.pops = []
+
+
+class GLR:
+    """
+    Mix-in running a PushDown automaton on every transition at once.
+
+    Rather than selecting one transition and backtracking, every allowed
+    transition is followed, in the style of Tomita's GLR parsing.  A
+    configuration is a state with the stack beneath it, and configurations
+    are run in order of their input position, so the input is read one
+    symbol at a time by all of them together.
+
+    The stacks of the configurations are merged into a graph-structured
+    stack: every push of the same state at the same input position shares one
+    node, which links to all the stacks it was pushed on.  Popping the node
+    resumes each of those stacks, and identical configurations are only run
+    once.  So an ambiguous grammar is recognized in polynomial time, where
+    backtracking could take exponential time, and left recursion, which would
+    send backtracking into an endless loop, is harmless.
+
+    The input is accepted by the first configuration with an empty stack
+    whose activity raises Accept, or which has no transitions and is in an
+    accepting state.  Raising Backtrack in an activity discards the
+    configuration.  A pop with an empty stack also discards it.  If no
+    configuration is accepted the input is rejected.
+
+    The tape must support mark() and reset_to(), as InputTape does, and the
+    tape is only retained from the input position being read.  Only the
+    input distinguishes configurations, so activities and transition tests
+    should examine the input and nothing else: application data, frames and
+    the on_suspend_state() and on_resume_state() notifications are not
+    maintained per configuration.
+
+    GLR must precede PushDown in the mro, and should not be combined with
+    Backtracking or BestFirst.
+
+    Attributes:
+        configurations: Number of configurations run.
+        stack_nodes: Number of nodes created in the graph-structured stack.
+    """
+    def __init__(self, **kw_args):
+        super().__init__(**kw_args)
+
+        self.configurations = 0
+        self.stack_nodes = 0
+
+        if __debug__:
+            mro = type(self).mro()
+            try:
+                if mro.index(GLR) > mro.index(PushDown):
+                    raise ValueError()
+            except ValueError:
+                raise TypeError("Class 'GLR' modifies class 'PushDown', and "\
+                                "must precede it in the mro.")
+
+    def _spawn(self, s_name, node, pos):
+        """
+        Queue a configuration, unless it has been queued before.
+        """
+        seen = self._seen.setdefault(pos, set())
+        if (s_name, node) in seen:
+            return
+        seen.add((s_name, node))
+        heapq.heappush(self._open, (pos, next(self._open_count), s_name, node))
+
+    def _push_node(self, s_name, node, pos):
+        """
+        Push a state on the stacks below node, merging with an existing node.
+
+        Returns:
+            The node on top of the stack.
+        """
+        top = self._tops.get((s_name, pos))
+        if top == None:
+            top = _StackNode(s_name, pos)
+            self._tops[(s_name, pos)] = top
+            self.stack_nodes += 1
+
+        if node not in top.below:
+            top.below[node] = None
+
+            # Resume the new stack wherever the node has already been popped.
+            resume = self.state_dict(s_name)['_resume_state']
+            for pop_pos in top.pops:
+                self._spawn(resume, node, pop_pos)
+        return top
+
+    def _pop_node(self, node, pos):
+        """
+        Pop a node, resuming every stack below it.
+        """
+        if node == None or pos in node.pops:
+            return
+        node.pops.append(pos)
+
+        resume = self.state_dict(node.s_name)['_resume_state']
+        for below in node.below:
+            self._spawn(resume, below, pos)
+
+    def _advance_to(self, pos):
+        """
+        Move on to the configurations at an input position.
+
+        Nothing is queued before the position from here on, so the records
+        kept for earlier positions are dropped, and their input released.
+        """
+        self._tops = dict((key, top) for key, top in self._tops.items()
+                          if top.pos >= pos)
+        for mark_pos in [p for p in self._tape_marks if p < pos]:
+            self.release(self._tape_marks.pop(mark_pos))
+            self._seen.pop(mark_pos, None)
+
+    def _expand(self, s_name, node, pos):
+        """
+        Run a configuration, and queue the configurations following it.
+        """
+        self.reset_to(self._tape_marks[pos])
+        self.current_state = s_name
+        self.configurations += 1
+        self._enter()
+
+        try:
+            self._do_activity()
+        except Backtrack:
+            return
+        except Accept:
+            if node == None:
+                raise
+            return
+
+        pos = self.pos
+        if pos not in self._tape_marks:
+            self._tape_marks[pos] = self.mark()
+
+        state_dict = self.state_dict(s_name)
+        if state_dict.get('_push_state'):
+            node = self._push_node(s_name, node, pos)
+        elif state_dict.get('_pop_state'):
+            self._exit()
+            self._pop_node(node, pos)
+            return
+
+        allowed_transitions = self._allowed_transitions()
+        self.on_pre_select_transition(s_name, allowed_transitions)
+        if len(allowed_transitions) == 0:
+            if node == None and self.accepting:
+                raise Accept()
+            return
+
+        self._exit()
+        for next_state in allowed_transitions:
+            self.on_transition(s_name, next_state)
+            self._spawn(next_state, node, pos)
+
+    def _run(self):
+        """
+        Run every configuration, in order of input position, until one is
+        accepted.
+        """
+        assert self._current_state, "Initial state not set."
+
+        # Heap of (pos, count, state, node).  The count breaks ties in first
+        # in, first out order.
+        self._open = []
+        self._open_count = itertools.count()
+
+        # Input position -> configurations queued at it, as (state, node).
+        self._seen = dict()
+
+        # (push state, input position) -> node, from the current position on.
+        self._tops = dict()
+
+        # Input position -> tape mark.
+        self._tape_marks = {self.pos: self.mark()}
+
+        self._spawn(self._current_state, None, self.pos)
+        current_pos = self.pos
+        try:
+            while self._open:
+                pos, count, s_name, node = heapq.heappop(self._open)
+                if pos != current_pos:
+                    self._advance_to(pos)
+                    current_pos = pos
+                self._expand(s_name, node, pos)
+        finally:
+            for mark in self._tape_marks.values():
+                self.release(mark)
+            self._tape_marks = dict()
+
+        raise Reject("No configuration was accepted.")
@@ -0,0 +1,535 @@
+"""LL(1) grammars compiled into pushdown automata"""
+
+import re
+
+from pycog.statemachine import state
+from pycog.pushdown import PushDown, push_state, pop_state
+from pycog.exceptions import Reject, GrammarError
+
+
+_token_re = re.compile(r"""
+      (?P<space>\s+|\#[^\n]*)
+    | (?P<define>::=|->)
+    | (?P<name>[A-Za-z_]\w*|<[^<>\s][^<>]*>)
+    | (?P<literal>"[^"\n]*"|'[^'\n]*')
+    | (?P<op>[|()\[\]*+?])
+    """, re.VERBOSE)
+
+
+class _Reader:
+    """
+    Reader for the text of a grammar, desugaring EBNF into BNF as it goes.
+    """
+    def __init__(self, grammar, text):
+        self.grammar = grammar
+        self.tokens = list(self._tokenize(text))
+        self.index = 0
+
+        # Rule being read, and the number of helpers made up for it.
+        self.rule = None
+        self.helper_count = 0
+
+    @staticmethod
+    def _tokenize(text):
+        """Generate (kind, value, line) for the tokens of the text."""
+        pos = 0
+        line = 1
+        while pos < len(text):
+            match = _token_re.match(text, pos)
+            if match == None:
+                raise GrammarError("Unexpected {ch!r} on line {ln}.".format(
+                    ch=text[pos], ln=line))
+            kind = match.lastgroup
+            value = match.group()
+            if kind == 'name' and value.startswith('<'):
+                value = value[1:-1]
+            elif kind == 'literal':
+                value = value[1:-1]
+                if value == '':
+                    raise GrammarError("Empty literal on line {ln}.".format(
+                        ln=line))
+            if kind != 'space':
+                yield kind, value, line
+            line += match.group().count('\n')
+            pos = match.end()
+
+    def _peek(self, offset=0):
+        """Return the (kind, value, line) of a token, or Nones at the end."""
+        index = self.index + offset
+        if index < len(self.tokens):
+            return self.tokens[index]
+        return None, None, None
+
+    def _at_rule(self):
+        """Return whether a rule starts at the current token."""
+        return self._peek()[0] == 'name' and self._peek(1)[0] == 'define'
+
+    def _error(self, expected):
+        kind, value, line = self._peek()
+        if kind == None:
+            raise GrammarError("Expected {exp} at the end of the grammar."\
+                               .format(exp=expected))
+        raise GrammarError("Expected {exp} on line {ln}, found {val!r}."\
+                           .format(exp=expected, ln=line, val=value))
+
+    def read(self):
+        """Read every rule, adding their productions to the grammar."""
+        if not self.tokens:
+            raise GrammarError("The grammar has no rules.")
+        while self.index < len(self.tokens):
+            if not self._at_rule():
+                self._error("a rule")
+            self.rule = self._peek()[1]
+            self.index += 2
+
+            # Rules come before their helpers, so the first rule is first.
+            self.grammar.productions.setdefault(self.rule, [])
+            for body in self._alternatives():
+                self.grammar._add(self.rule, body)
+
+    def _helper(self, alternatives):
+        """Make up a nonterminal for a group, option or repetition."""
+        self.helper_count += 1
+        name = '{rule}#{n}'.format(rule=self.rule, n=self.helper_count)
+        self.grammar.helpers.add(name)
+        for body in alternatives:
+            self.grammar._add(name, body)
+        return name
+
+    def _alternatives(self):
+        """Read sequences separated by '|'."""
+        alternatives = [self._sequence()]
+        while self._peek()[:2] == ('op', '|'):
+            self.index += 1
+            alternatives.append(self._sequence())
+        return alternatives
+
+    def _sequence(self):
+        """Read items up to the end of an alternative."""
+        body = []
+        while True:
+            kind, value, line = self._peek()
+            if kind == None or self._at_rule() or \
+                    (kind == 'op' and value in '|)]'):
+                return tuple(body)
+            body.extend(self._item())
+
+    def _item(self):
+        """
+        Read a primary and any repetition suffix.
+
+        Returns:
+            A tuple of symbols to be added to the sequence.
+        """
+        symbols = self._primary()
+        kind, value, line = self._peek()
+        if kind != 'op' or value not in '*+?':
+            return symbols
+        self.index += 1
+
+        if value == '?':
+            return (self._helper([symbols, ()]),)
+
+        repeat = self._helper([])
+        self.grammar._add(repeat, symbols + (repeat,))
+        self.grammar._add(repeat, ())
+        if value == '*':
+            return (repeat,)
+        return symbols + (repeat,)
+
+    def _primary(self):
+        """Read a symbol, a group or an option."""
+        kind, value, line = self._peek()
+        self.index += 1
+        if kind == 'name':
+            return (value,)
+        if kind == 'literal':
+            self.grammar.literals.add(value)
+            return (value,)
+        if (kind, value) == ('op', '('):
+            alternatives = self._alternatives()
+            self._close(')')
+            if len(alternatives) == 1:
+                return alternatives[0]
+            return (self._helper(alternatives),)
+        if (kind, value) == ('op', '['):
+            alternatives = self._alternatives()
+            self._close(']')
+            return (self._helper(alternatives + [()]),)
+        self.index -= 1
+        self._error("a symbol")
+
+    def _close(self, bracket):
+        if self._peek()[:2] != ('op', bracket):
+            self._error(repr(bracket))
+        self.index += 1
+
+
+class Grammar:
+    """
+    A context-free grammar, with its FIRST and FOLLOW sets and LL(1) table.
+
+    Rules are written in BNF or EBNF, one or more to a line:
+
+        expr ::= term ("+" term)*
+        term ::= "a" | "(" expr ")"
+
+    Quoted strings are terminals, and names are nonterminals if they have a
+    rule, or terminals otherwise, e.g. the kinds of tokens from a lexer.
+    Names may also be written as <name>.  Either ::= or -> may define a rule,
+    and a rule may be given more than once to add alternatives.  Alternatives
+    are separated by |, and may be empty.  (...) groups, [...] is optional,
+    and *, + and ? repeat the item before them.  # starts a comment.
+
+    EBNF is rewritten into BNF with helper nonterminals, named after their
+    rule, e.g. 'expr#1'.
+
+    None stands for the end of the input in FOLLOW sets and the table.
+
+    Raises:
+        GrammarError: The grammar can't be read, or isn't LL(1).
+
+    Attributes:
+        start: The start symbol, the first rule's unless given.
+        productions: Dictionary of nonterminal -> list of alternatives, each
+            a tuple of symbols.
+        helpers: Set of the helper nonterminals.
+        terminals: Frozen set of the terminals.
+        literals: Set of the terminals written as quoted strings.
+        nullable: Frozen set of the nonterminals deriving the empty string.
+        first: Dictionary of nonterminal -> frozen set of terminals.
+        follow: Dictionary of nonterminal -> frozen set of terminals.
+        table: Dictionary of (nonterminal, terminal) -> alternative.
+    """
+    def __init__(self, text, start=None):
+        self.productions = dict()
+        self.helpers = set()
+        self.literals = set()
+        _Reader(self, text).read()
+
+        clashes = self.literals & set(self.productions)
+        if clashes:
+            raise GrammarError("Literals also used as rule names: {names}."\
+                               .format(names=', '.join(sorted(clashes))))
+
+        if start == None:
+            start = next(iter(self.productions))
+        elif start not in self.productions:
+            raise GrammarError("No rule for the start symbol {st!r}.".format(
+                st=start))
+        self.start = start
+
+        self.terminals = frozenset(symbol
+                                   for bodies in self.productions.values()
+                                   for body in bodies for symbol in body
+                                   if symbol not in self.productions)
+        self._compute_nullable()
+        self._compute_first()
+        self._compute_follow()
+        self._compute_table()
+
+    def _add(self, nonterminal, body):
+        """Add an alternative for a nonterminal."""
+        self.productions.setdefault(nonterminal, []).append(tuple(body))
+
+    def first_of(self, symbols):
+        """
+        Return the FIRST set of a sequence of symbols.
+
+        Returns:
+            (terminals, nullable), the terminals that can start the sequence,
+            and whether it can derive the empty string.
+        """
+        terminals = set()
+        for symbol in symbols:
+            if symbol not in self.productions:
+                terminals.add(symbol)
+                return terminals, False
+            terminals |= self.first[symbol]
+            if symbol not in self.nullable:
+                return terminals, False
+        return terminals, True
+
+    def _compute_nullable(self):
+        nullable = set()
+        changed = True
+        while changed:
+            changed = False
+            for nonterminal, bodies in self.productions.items():
+                if nonterminal in nullable:
+                    continue
+                if any(all(symbol in nullable for symbol in body)
+                       for body in bodies):
+                    nullable.add(nonterminal)
+                    changed = True
+        self.nullable = frozenset(nullable)
+
+    def _compute_first(self):
+        first = dict((nonterminal, set()) for nonterminal in self.productions)
+        self.first = first
+        changed = True
+        while changed:
+            changed = False
+            for nonterminal, bodies in self.productions.items():
+                for body in bodies:
+                    terminals, nullable = self.first_of(body)
+                    if not terminals <= first[nonterminal]:
+                        first[nonterminal] |= terminals
+                        changed = True
+        self.first = dict((nonterminal, frozenset(terminals))
+                          for nonterminal, terminals in first.items())
+
+    def _compute_follow(self):
+        follow = dict((nonterminal, set()) for nonterminal in self.productions)
+        follow[self.start].add(None)
+        changed = True
+        while changed:
+            changed = False
+            for nonterminal, bodies in self.productions.items():
+                for body in bodies:
+                    for index, symbol in enumerate(body):
+                        if symbol not in self.productions:
+                            continue
+                        terminals, nullable = self.first_of(body[index + 1:])
+                        if nullable:
+                            terminals |= follow[nonterminal]
+                        if not terminals <= follow[symbol]:
+                            follow[symbol] |= terminals
+                            changed = True
+        self.follow = dict((nonterminal, frozenset(terminals))
+                           for nonterminal, terminals in follow.items())
+
+    def _compute_table(self):
+        """
+        Build the LL(1) table, reporting every conflict at once.
+        """
+        table = dict()
+        conflicts = []
+        for nonterminal, bodies in self.productions.items():
+            for body in bodies:
+                terminals, nullable = self.first_of(body)
+                if nullable:
+                    terminals |= self.follow[nonterminal]
+                for terminal in terminals:
+                    key = (nonterminal, terminal)
+                    if key in table and table[key] != body:
+                        conflicts.append(
+                            "{nt}: {a} and {b} both predicted by {t}.".format(
+                                nt=nonterminal, a=_format(table[key]),
+                                b=_format(body),
+                                t=_format_terminal(terminal)))
+                        continue
+                    table[key] = body
+
+        if conflicts:
+            raise GrammarError("The grammar is not LL(1):\n" +
+                               '\n'.join(conflicts))
+        self.table = table
+
+    def expected(self, nonterminal):
+        """
+        Return the terminals that may start a nonterminal, sorted, with None
+        last if it may be followed by the end of the input.
+        """
+        terminals = [terminal for (head, terminal) in self.table
+                     if head == nonterminal]
+        return sorted(terminals, key=lambda t: (t == None, str(t)))
+
+
+def _format_terminal(terminal):
+    if terminal == None:
+        return 'end of input'
+    return repr(terminal)
+
+def _format(body):
+    if not body:
+        return '(empty)'
+    return ' '.join(body)
+
+
+# Compiled grammars, by text and start symbol.
+_grammars = {}
+
+def compile_grammar(text, start=None):
+    """
+    Return the Grammar for a text, compiling it only the first time.
+
+    Args:
+        text: The rules of the grammar, see Grammar.
+        start: The start symbol, by default the first rule's.
+
+    Raises:
+        GrammarError: The grammar can't be read, or isn't LL(1).
+    """
+    key = (text, start)
+    try:
+        return _grammars[key]
+    except KeyError:
+        pass
+    grammar = Grammar(text, start)
+    _grammars[key] = grammar
+    return grammar
+
+
+class LL1Parser(PushDown):
+    """
+    Pushdown automaton parsing by the table of an LL(1) grammar.
+
+    Each nonterminal is parsed in its own frame, pushed when the nonterminal
+    is reached: the alternative to parse is chosen with one lookup in the
+    table, by the nonterminal and the current symbol, and its terminals are
+    matched until the next nonterminal is pushed or the frame is popped.
+
+    The grammar is given by the grammar class attribute, or the grammar
+    argument, as text or a Grammar, and is compiled once and cached.  An
+    input tape must be mixed in, e.g. InputTape for a character per symbol,
+    or IterableTape over the tokens from a lexer.  terminal() maps symbols
+    to the terminals of the grammar.
+
+    The parse tree is built bottom up by reduce(), and left in tree when the
+    input is accepted.  Helper nonterminals made up for EBNF don't get nodes
+    of their own: their children go to the node of their rule.  On a syntax
+    error the input is rejected, with a message in error_msg and the
+    position of the error in error_pos.
+    """
+    grammar = None
+    frame_fields = ('nonterminal', 'body', 'index', 'children', 'value')
+
+    def __init__(self, grammar=None, start=None, **kw_args):
+        super().__init__(initial='start', **kw_args)
+
+        if grammar == None:
+            grammar = self.grammar
+        if not isinstance(grammar, Grammar):
+            grammar = compile_grammar(grammar, start)
+        self.grammar = grammar
+
+        self.tree = None
+        self.error_msg = ''
+        self.error_pos = None
+
+        # Nonterminal to be pushed next.
+        self._callee = grammar.start
+
+    def terminal(self, symbol):
+        """
+        Return the terminal of the grammar for a symbol of the tape.
+
+        The default is the symbol itself.  Override this to use the kinds of
+        tokens, or classes of characters such as letters, as terminals.
+        """
+        return symbol
+
+    def reduce(self, nonterminal, children):
+        """
+        Return the parse tree node for a nonterminal.
+
+        Args:
+            nonterminal: The nonterminal parsed.
+            children: List of the symbols matched and the nodes of the
+                nonterminals parsed, in order.
+
+        The default node is (nonterminal, tuple(children)).
+        """
+        return (nonterminal, tuple(children))
+
+    def _lookahead(self):
+        """Return the terminal of the current symbol, None at the end."""
+        if self.symbol == self.eof:
+            return None
+        return self.terminal(self.symbol)
+
+    def _syntax_error(self, expected):
+        """Reject the input, expecting one of a list of terminals."""
+        self.error_pos = self.pos
+        found = self._lookahead()
+        self.error_msg = "Expected {exp} at position {pos}, found {fd}."\
+                .format(exp=' or '.join(map(_format_terminal, expected)),
+                        pos=self.pos, fd=_format_terminal(found))
+        raise Reject(self.error_msg)
+
+    def on_resume_state(self, s_name):
+        """
+        Add the node of the nonterminal just parsed to its parent.
+        """
+        returned = self.returned_frame
+        if s_name == 'start':
+            self.tree = returned.value
+        else:
+            # Frames are copied on write, and the copies are shallow, so the
+            # list of children is replaced rather than added to.
+            frame = self.active_frame
+            if returned.nonterminal in self.grammar.helpers:
+                frame.children = frame.children + returned.value
+            else:
+                frame.children = frame.children + [returned.value]
+
+        super().on_resume_state(s_name)
+
+    @push_state('start', resume='end', transitions=['predict'])
+    def start(self):
+        pass
+
+    @state('predict', transitions=['scan'])
+    def predict(self):
+        nonterminal = self._callee
+        try:
+            body = self.grammar.table[(nonterminal, self._lookahead())]
+        except KeyError:
+            self._syntax_error(self.grammar.expected(nonterminal))
+
+        frame = self.active_frame
+        frame.nonterminal = nonterminal
+        frame.body = body
+        frame.index = 0
+        frame.children = []
+
+    @state('scan')
+    def scan(self):
+        frame = self.active_frame
+        body = frame.body
+        index = frame.index
+        productions = self.grammar.productions
+        matched = []
+        while index < len(body):
+            symbol = body[index]
+            if symbol in productions:
+                break
+            if self._lookahead() != symbol:
+                frame.index = index
+                self._syntax_error([symbol])
+            matched.append(self.symbol)
+            self.advance()
+            index += 1
+
+        if matched:
+            frame.children = frame.children + matched
+        frame.index = index
+        if index < len(body):
+            self._callee = body[index]
+        else:
+            self._callee = None
+    @scan.transition('call')
+    def scan(self):
+        return self._callee != None
+    @scan.transition('return')
+    def scan(self):
+        return self._callee == None
+
+    @push_state('call', resume='scan', transitions=['predict'])
+    def call(self):
+        # Resume after the nonterminal.
+        self.active_frame.index += 1
+
+    @pop_state('return')
+    def return_(self):
+        frame = self.active_frame
+        if frame.nonterminal in self.grammar.helpers:
+            frame.value = frame.children
+        else:
+            frame.value = self.reduce(frame.nonterminal, frame.children)
+
+    @state('end', accepting=True)
+    def end(self):
+        if self._lookahead() != None:
+            self._syntax_error([None])
@@ -1,16 +1,48 @@
 """Adds an input tape to a state machine."""
 
+import bisect
+import codecs
+import mmap
+import os
+
+# End of tape sentinel for BytesTape.  It is one past the largest byte value, so
+# a table of BYTE_EOF + 1 entries can be indexed directly by any symbol.
+BYTE_EOF = 256
+
 class InputTape:
+    """
+    Input tape over a text stream.
+
+    Symbols are read from the stream one at a time, and '' marks the end of the
+    tape.
+
+    mark() and reset_to() allow the tape to be rewound.  Symbols read while any
+    mark is live are retained so they can be replayed after reset_to(), and are
+    released once no live mark refers to them.  Retention is therefore bounded
+    by the oldest live mark, and costs nothing when no marks are in use.
+    """
+    eof = ''
+
     def __init__(self, stream=None, **kw_args):
         super().__init__(**kw_args)
 
         assert stream != None
 
         self.stream = stream
-        self._symbol = ''
-        self.pos = 0
+        self._symbol = self.eof
+
+        # Symbols retained for rewinding.  _buffer[0] is the symbol at position
+        # _buffer_start, and the buffer runs up to _read_pos, the position of
+        # the next symbol to be read from the stream.
+        self._buffer = []
+        self._buffer_start = 0
+        self._read_pos = 0
+
+        # Live marks: position -> number of times marked.
+        self._marks = dict()
+
+        self.pos = -1
         self.advance()
-        self.pos = 0
 
     @property
     def symbol(self):
@@ -18,12 +50,563 @@ class InputTape:
         return self._symbol
     def advance(self):
         """Advance the stream position"""
-        self._symbol = self.stream.read(1)
         self.pos += 1
+        if self.pos < self._read_pos:
+            # Replaying retained symbols after reset_to().
+            self._symbol = self._buffer[self.pos - self._buffer_start]
+        else:
+            self._symbol = self._read()
+            self._read_pos = self.pos + 1
+            if self._marks:
+                self._buffer.append(self._symbol)
+            elif self._buffer:
+                self._buffer = []
+        return self._symbol
+
+    def _read(self):
+        """Read the next symbol from the stream."""
+        return self.stream.read(1)
+
+    def mark(self):
+        """
+        Mark the current position so the tape can be reset to it.
+
+        Each mark must eventually be passed to release(), otherwise the input
+        following it is retained indefinitely.
+
+        Returns:
+            The mark, to be passed to reset_to() and release().
+        """
+        if not self._buffer:
+            self._buffer = [self._symbol]
+            self._buffer_start = self.pos
+        self._marks[self.pos] = self._marks.get(self.pos, 0) + 1
+        return self.pos
+
+    def reset_to(self, mark):
+        """
+        Rewind (or fast-forward) the tape to a live mark.
+
+        Args:
+            mark: A mark returned by mark() and not yet released.
+        """
+        assert mark in self._marks, "Tape mark is not live."
+        self.pos = mark
+        self._symbol = self._buffer[mark - self._buffer_start]
+
+    def release(self, mark):
+        """
+        Release a mark, allowing the input retained for it to be discarded.
+
+        Args:
+            mark: A mark returned by mark().
+        """
+        count = self._marks[mark] - 1
+        if count > 0:
+            self._marks[mark] = count
+            return
+        del self._marks[mark]
+
+        if self._buffer_start in self._marks:
+            # The oldest retained symbol is still marked.
+            return
+
+        keep = self.pos
+        if self._marks:
+            keep = min(keep, min(self._marks))
+        del self._buffer[0:keep - self._buffer_start]
+        self._buffer_start = keep
+
+    def accept_test(self):
+        if self._symbol != self.eof:
+            return False
+        return super().accept_test()
+
+
+class IterableTape(InputTape):
+    """
+    Input tape over any iterable of symbols.
+
+    Symbols are pulled from the iterable one at a time as the tape advances,
+    so the iterable may be a generator, e.g. tokens produced by a lexer or
+    records from a pipeline, and is never turned into a list.  A string works
+    too, giving one character per symbol.
+
+    eof is the symbol reported once the iterable is exhausted, None by default.
+    Marks work as for InputTape.
+    """
+    def __init__(self, symbols=None, eof=None, **kw_args):
+        assert symbols != None
+
+        self.eof = eof
+        super().__init__(stream=iter(symbols), **kw_args)
+
+    def _read(self):
+        """Read the next symbol from the iterator."""
+        return next(self.stream, self.eof)
+
+
+class MmapInputTape:
+    """
+    Input tape over a memory-mapped file.
+
+    The file is mapped read-only and symbols are taken from the mapping one at
+    a time, so the input is never copied wholesale into Python strings and may
+    be larger than memory.
+
+    Without an encoding each symbol is a bytes object of length one, and b''
+    marks the end of the tape.  With an encoding the bytes are decoded
+    incrementally, each symbol is a one character string, and '' marks the
+    end of the tape.
+
+    Unlike InputTape, pos is the byte offset of the current symbol in the file.
+    This makes seek() and span() O(1) regardless of the size of the input.
+    """
+    def __init__(self, path=None, encoding=None, errors='strict', **kw_args):
+        super().__init__(**kw_args)
+
+        assert path != None
+
+        self.path = path
+        self.encoding = encoding
+
+        self._file = open(path, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+        if self._size == 0:
+            # Empty files can't be mapped.
+            self._map = b''
+        else:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+        if encoding == None:
+            self._decoder = None
+            self.eof = b''
+        else:
+            self._decoder = codecs.getincrementaldecoder(encoding)(errors)
+            self.eof = ''
+
+        self.seek(0)
+
+    @property
+    def symbol(self):
+        """Return the current symbol"""
+        return self._symbol
+
+    def advance(self):
+        """Advance the tape position"""
+        self.pos = self._next
+        self._read()
+        return self._symbol
+
+    def seek(self, pos):
+        """
+        Move the tape to a byte offset.
+
+        Args:
+            pos: Byte offset of the new current symbol.  With an encoding this
+                must be the start of an encoded character.
+        """
+        self.pos = pos
+        self._read()
+
+    def mark(self):
+        """
+        Mark the current position so the tape can be reset to it.
+
+        The whole file is always available, so marks cost nothing.
+        """
+        return self.pos
+
+    def reset_to(self, mark):
+        """Move the tape to a mark returned by mark()."""
+        self.seek(mark)
+
+    def release(self, mark):
+        """Release a mark.  This is a no-op for mapped files."""
+        pass
+
+    def span(self, start, end):
+        """
+        Return the input between two byte offsets.
+
+        This is intended for error reporting and similar uses, and only copies
+        the requested span.  The result is decoded if the tape has an encoding.
+        """
+        data = self._map[start:end]
+        if self._decoder == None:
+            return data
+        return codecs.decode(data, self.encoding)
+
+    def close(self):
+        """Release the mapping and close the file."""
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def _read(self):
+        """Read the symbol at pos, and note where the next one starts."""
+        start = self.pos
+        if self._decoder == None:
+            self._symbol = self._map[start:start + 1]
+            self._next = start + len(self._symbol)
+            return
+
+        # Feed bytes one at a time until a full character is decoded.
+        self._decoder.reset()
+        symbol = ''
+        end = start
+        while not symbol and end < self._size:
+            symbol = self._decoder.decode(self._map[end:end + 1])
+            end += 1
+        if not symbol:
+            # Raises for a truncated character at the end of the file.
+            symbol = self._decoder.decode(b'', True)
+
+        self._symbol = symbol
+        self._next = end
+
+    def accept_test(self):
+        if self._symbol != self.eof:
+            return False
+        return super().accept_test()
+
+
+class BytesTape:
+    """
+    Input tape over binary data with integer symbols.
+
+    The data may be any object supporting the buffer protocol, e.g. bytes,
+    bytearray or an mmap.  It is accessed through a memoryview, so span()
+    returns zero-copy slices.
+
+    Each symbol is an int in range(256), and BYTE_EOF marks the end of the
+    tape.  Since BYTE_EOF is not falsy, test for it explicitly rather than
+    relying on the truth value of the symbol.  Symbols can index tables built
+    with byte_table() directly, so a transition test costs one lookup.
+    """
+    eof = BYTE_EOF
+
+    def __init__(self, data=None, **kw_args):
+        super().__init__(**kw_args)
+
+        assert data != None
+
+        self.data = memoryview(data)
+        if self.data.format != 'B':
+            self.data = self.data.cast('B')
+        self._size = len(self.data)
+
+        self.seek(0)
+
+    @property
+    def symbol(self):
+        """Return the current symbol"""
+        return self._symbol
+
+    def advance(self):
+        """Advance the tape position"""
+        self.pos += 1
+        if self.pos < self._size:
+            self._symbol = self.data[self.pos]
+        else:
+            self._symbol = BYTE_EOF
         return self._symbol
 
+    def seek(self, pos):
+        """
+        Move the tape to an offset.
+
+        Args:
+            pos: Offset of the new current symbol.
+        """
+        self.pos = pos
+        if pos < self._size:
+            self._symbol = self.data[pos]
+        else:
+            self._symbol = BYTE_EOF
+
+    def mark(self):
+        """
+        Mark the current position so the tape can be reset to it.
+
+        The whole buffer is always available, so marks cost nothing.
+        """
+        return self.pos
+
+    def reset_to(self, mark):
+        """Move the tape to a mark returned by mark()."""
+        self.seek(mark)
+
+    def release(self, mark):
+        """Release a mark.  This is a no-op for binary data."""
+        pass
+
+    def span(self, start, end):
+        """Return a memoryview of the data between two offsets."""
+        return self.data[start:end]
+
     def accept_test(self):
-        if self._symbol != '':
+        if self._symbol != BYTE_EOF:
             return False
         return super().accept_test()
 
+
+def byte_table(symbols, value=True, default=False):
+    """
+    Build a lookup table indexed by BytesTape symbols.
+
+    Args:
+        symbols: Byte values to map to value, e.g. b'()' or range(48, 58).
+            Include BYTE_EOF to map the end of the tape.
+        value: Table entry for the given symbols.
+        default: Table entry for all other symbols.
+
+    Returns:
+        A tuple of BYTE_EOF + 1 entries.
+    """
+    table = [default]*(BYTE_EOF + 1)
+    for symbol in symbols:
+        table[symbol] = value
+    return tuple(table)
+
+def byte_test(symbols):
+    """
+    Make a transition test that passes if the current symbol is in symbols.
+
+    The test is a single table lookup on the current symbol.  See byte_table().
+    """
+    table = byte_table(symbols)
+    def _byte_test(fsm, cur_state, next_state):
+        """Transition test generated by byte_test()."""
+        return table[fsm.symbol]
+    return _byte_test
+
+
+class _Starved(Exception):
+    """FeedTape has run out of input.  For internal use."""
+    pass
+
+class _Pending:
+    """
+    Stand-in returned by FeedTape.advance() for a symbol that hasn't arrived.
+
+    Using it in any way runs out of input, just as reading symbol would.  For
+    internal use.
+    """
+    __slots__ = ()
+
+    def _starve(self, *args):
+        raise _Starved()
+
+    __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = _starve
+    __hash__ = __bool__ = __index__ = __len__ = __iter__ = _starve
+    __contains__ = __getitem__ = __str__ = __int__ = _starve
+    __add__ = __radd__ = _starve
+
+    def __getattr__(self, name):
+        raise _Starved()
+
+    def __repr__(self):
+        return '<pending symbol>'
+
+_PENDING = _Pending()
+
+class FeedTape:
+    """
+    Input tape that is fed input incrementally.
+
+    Instead of calling run(), pass each chunk of input to feed() as it
+    arrives, and call close() after the last one.  The state machine runs as
+    far as the input allows, then suspends until the next chunk arrives.  All
+    state is kept in the instance, so no threads are needed and any number of
+    machines can be fed in an interleaved fashion.
+
+    Chunks may be strings, bytes or lists of tokens, but all chunks fed to one
+    tape must be the same type.  Symbols are items of the chunks, so symbols
+    fed as bytes are ints, in which case pass eof=BYTE_EOF.
+
+    The machine suspends between steps.  When an activity or transition test
+    reads a symbol that hasn't arrived, the tape is rewound to where that
+    activity or transition began, and it is retried when more input arrives.
+    Only reading a symbol can run out of input: if the symbol advance()
+    returns hasn't arrived, it's a stand-in that runs out of input only when
+    it's used, so an activity may end with advance() at the end of the fed
+    input.  Activities should read the input they need before making other
+    changes, as in the PsAndQs example.  The exit hooks of a state aren't
+    repeated when its transition is retried.  Fed input is discarded once the
+    machine has moved past it and no mark refers to it.
+    """
+    def __init__(self, eof='', **kw_args):
+        super().__init__(**kw_args)
+
+        self.eof = eof
+        self.result = None
+
+        # Unconsumed input, as the chunks fed.  _chunks[i] starts at position
+        # _starts[i], and _end is the position after the last chunk.
+        self._chunks = []
+        self._starts = []
+        self._end = 0
+        self._closed = False
+
+        # Live marks: position -> number of times marked.
+        self._marks = dict()
+
+        # Where to rewind to when the input runs out, and whether the current
+        # state's activity has completed.
+        self._checkpoint = 0
+        self._activity_done = False
+        self._started = False
+
+        # Whether the current state has been exited, and whether to skip
+        # exiting it again when its transition is retried.
+        self._exited = False
+        self._skip_exit = False
+
+        self.pos = 0
+
+    @property
+    def symbol(self):
+        """Return the current symbol"""
+        pos = self.pos
+        if pos < self._end:
+            i = bisect.bisect_right(self._starts, pos) - 1
+            return self._chunks[i][pos - self._starts[i]]
+        if self._closed:
+            return self.eof
+        raise _Starved()
+
+    def advance(self):
+        """
+        Advance the tape position.
+
+        Returns:
+            The new current symbol.  If it hasn't arrived yet, a stand-in that
+            runs out of input when it's used.
+        """
+        self.pos += 1
+        if self.pos < self._end or self._closed:
+            return self.symbol
+        return _PENDING
+
+    def feed(self, chunk):
+        """
+        Add input and run the state machine as far as it allows.
+
+        Args:
+            chunk: The next piece of input.
+
+        Returns:
+            None if the machine is waiting for more input, otherwise the
+            result of run().
+        """
+        assert not self._closed, "Input fed after close()."
+        if len(chunk) > 0:
+            self._chunks.append(chunk)
+            self._starts.append(self._end)
+            self._end += len(chunk)
+        return self._pump()
+
+    def close(self):
+        """
+        Signal the end of the input, and run the state machine to completion.
+
+        Returns:
+            The result of run().
+        """
+        self._closed = True
+        return self._pump()
+
+    def _pump(self):
+        """Run until the machine halts or runs out of input."""
+        if self.result == None:
+            try:
+                self.result = self.run()
+            except _Starved:
+                self.pos = self._checkpoint
+                self._skip_exit = self._exited
+                self._discard()
+        return self.result
+
+    def _discard(self):
+        """Drop input that can no longer be needed."""
+        keep = self._checkpoint
+        if self._marks:
+            keep = min(keep, min(self._marks))
+        # Keep the chunk holding position keep, and those after it.
+        drop = bisect.bisect_right(self._starts, keep) - 1
+        if drop > 0:
+            del self._chunks[:drop]
+            del self._starts[:drop]
+
+    def mark(self):
+        """
+        Mark the current position so the tape can be reset to it.
+
+        Returns:
+            The mark, to be passed to reset_to() and release().
+        """
+        self._marks[self.pos] = self._marks.get(self.pos, 0) + 1
+        return self.pos
+
+    def reset_to(self, mark):
+        """Move the tape to a mark returned by mark()."""
+        assert mark in self._marks, "Tape mark is not live."
+        self.pos = mark
+
+    def release(self, mark):
+        """Release a mark, allowing the input it refers to be discarded."""
+        count = self._marks[mark] - 1
+        if count > 0:
+            self._marks[mark] = count
+        else:
+            del self._marks[mark]
+
+    def _run(self):
+        """
+        Run, resuming where the machine last ran out of input.
+        """
+        if not self._started:
+            assert self._current_state, "Initial state not set."
+            self._started = True
+            self._enter()
+        while True:
+            self._step()
+
+    def on_enter_state(self, s_name):
+        """
+        Handle on_enter notifications.
+
+        The new state's activity has yet to run.
+        """
+        self._activity_done = False
+        self._exited = False
+        self._skip_exit = False
+        super().on_enter_state(s_name)
+
+    def _exit(self):
+        """
+        Exit the current state, unless it was exited before the input ran out.
+        """
+        if self._skip_exit:
+            self._skip_exit = False
+            return
+        super()._exit()
+        self._exited = True
+
+    def _do_activity(self):
+        """
+        Run the activity, unless it completed before the input ran out.
+        """
+        if self._activity_done:
+            return
+        self._checkpoint = self.pos
+        super()._do_activity()
+        self._activity_done = True
+        self._checkpoint = self.pos
+
+    def accept_test(self):
+        if self.symbol != self.eof:
+            return False
+        return super().accept_test()
@@ -0,0 +1,196 @@
+"""Parallel backtracking over a pool of processes"""
+
+import multiprocessing
+
+from pycog.backtrack import Backtracking
+
+# Shared bound for the worker processes, see parallel_search().
+_shared_bound = None
+
+def split(fsm, depth):
+    """
+    Split a backtracking search into subtrees.
+
+    The state machine is run until its track holds depth + 1 occurrences, so
+    the initial state plus depth transitions, and each such path is set aside
+    by Backtracking.restrict_depth() instead of being searched further.
+
+    Args:
+        fsm: A Backtracking state machine that hasn't been run.
+        depth: The number of transitions in each path prefix.
+
+    Returns:
+        (prefixes, solutions), where prefixes is a list of path prefixes to
+        pass to Backtracking.restrict_path(), and solutions lists the solutions
+        accepted in fewer than depth transitions.
+    """
+    solutions = []
+    fsm.restrict_depth(depth)
+    fsm.run_all(solutions.append)
+    return fsm.set_aside, solutions
+
+def _publish(value):
+    """Lower the shared bound to a value, if it's lower."""
+    with _shared_bound.get_lock():
+        if value < _shared_bound.value:
+            _shared_bound.value = value
+
+class SharedBound:
+    """
+    Mix-in sharing a branch-and-bound bound between the workers of
+    parallel_search().
+
+    The attribute named by bound_attr holds the state machine's bound, lower
+    being better, and None meaning no bound.  The default, 'incumbent_value',
+    suits state machines that override objective().  The bound is compared
+    with the shared bound when the state machine is created, and each time an
+    occurrence is backtracked: a lower local value is published, and a lower
+    shared value is adopted.  So pruning in one worker benefits from the
+    solutions found by the rest.  In 'best' mode the key of each solution
+    found is also published.  Outside a worker nothing is shared.
+
+    SharedBound must precede Backtracking in the mro.
+    """
+    bound_attr = 'incumbent_value'
+
+    def __init__(self, **kw_args):
+        super().__init__(**kw_args)
+
+        if __debug__:
+            mro = type(self).mro()
+            try:
+                if mro.index(SharedBound) > mro.index(Backtracking):
+                    raise ValueError()
+            except ValueError:
+                raise TypeError("Class 'SharedBound' modifies class "\
+                                "'Backtracking', and must precede it in the "\
+                                "mro.")
+
+        self._sync_bound()
+
+    def _local_bound(self):
+        """Return the bound, with None meaning no bound yet."""
+        local = getattr(self, self.bound_attr)
+        if local == None:
+            return float('inf')
+        return local
+
+    def _sync_bound(self):
+        """Publish a lower bound, or adopt a lower shared bound."""
+        if _shared_bound == None:
+            return
+        local = self._local_bound()
+        shared = _shared_bound.value
+        if local < shared:
+            _publish(local)
+        elif shared < local:
+            current = getattr(self, self.bound_attr)
+            if current != None:
+                shared = type(current)(shared)
+            setattr(self, self.bound_attr, shared)
+
+    def on_backtrack(self, occ):
+        """
+        Synchronize the bound with the other workers.
+        """
+        super().on_backtrack(occ)
+        self._sync_bound()
+
+def _init_worker(shared_bound):
+    """Worker process initializer."""
+    global _shared_bound
+    _shared_bound = shared_bound
+
+def _search(args):
+    """
+    Search one subtree in a worker process.
+
+    Returns:
+        A list of solutions.
+    """
+    factory, prefix, mode, key = args
+
+    fsm = factory()
+    fsm.restrict_path(prefix)
+
+    if mode == 'first':
+        if not fsm.run():
+            return []
+        if fsm.incumbent_value != None:
+            # Branch-and-bound, which ends unwound.
+            if fsm.incumbent == None:
+                return []
+            return [fsm.incumbent]
+        return [fsm.solution()]
+
+    solutions = []
+    def _collect(solution):
+        """Keep the solution, or just the best one."""
+        if mode != 'best':
+            solutions.append(solution)
+            return
+
+        value = key(solution)
+        if solutions and key(solutions[0]) <= value:
+            return
+        solutions[:] = [solution]
+
+        if isinstance(fsm, SharedBound):
+            _publish(value)
+    fsm.run_all(_collect)
+    return solutions
+
+def parallel_search(factory, depth=1, mode='first', key=None, processes=None):
+    """
+    Run a backtracking search in parallel.
+
+    The first depth levels of the search tree are expanded in this process,
+    then the subtree below each path prefix is searched by a pool of worker
+    processes.
+
+    Args:
+        factory: Picklable callable returning a new Backtracking state
+            machine, e.g. the class or a functools.partial of it.
+        depth: Number of levels to expand before handing out subtrees.
+        mode: 'first' for the first solution found by any worker, 'all' for
+            every solution, or 'best' for the solution minimizing key.
+        key: Picklable callable returning the value of a solution, for 'best'.
+        processes: Number of worker processes, by default the CPU count.
+
+    Returns:
+        For 'first' and 'best' a solution, or None if there is none.  For
+        'all' a list of solutions, in no particular order.
+
+    Solutions are the values returned by the state machine's solution().
+    Mix SharedBound into a branch-and-bound state machine to share its bound
+    between the workers.
+    In 'first' mode a branch-and-bound worker's solution is its incumbent,
+    the best solution in its subtree.
+    """
+    assert mode in ('first', 'all', 'best'), "Unknown search mode."
+    assert mode != 'best' or key != None, "Mode 'best' needs a key."
+
+    prefixes, solutions = split(factory(), depth)
+    if mode == 'first' and solutions:
+        return solutions[0]
+
+    shared_bound = multiprocessing.Value('d', float('inf'))
+    if mode == 'best' and solutions:
+        shared_bound.value = min(key(solution) for solution in solutions)
+
+    tasks = [(factory, prefix, mode, key) for prefix in prefixes]
+    with multiprocessing.Pool(processes, _init_worker,
+                              (shared_bound,)) as pool:
+        for found in pool.imap_unordered(_search, tasks):
+            if mode == 'first' and found:
+                # Leaving the with statement terminates the other workers.
+                return found[0]
+            solutions.extend(found)
+
+    if mode == 'all':
+        return solutions
+    if not solutions:
+        return None
+    if mode == 'best':
+        return min(solutions, key=key)
+    return solutions[0]
@@ -1,6 +1,10 @@
 """Non-deterministic pushdown automata"""
 
-from pycog.exceptions import StateStackEmpty
+import copy
+import sys
+from collections import OrderedDict
+
+from pycog.exceptions import StateStackEmpty, StackOverflow, Backtrack
 import pycog.statemachine as sm
 
 
@@ -46,34 +50,242 @@ class Frame:
     pass
 
 
+# Slotted frame classes, by their fields.
+_frame_classes = {}
+
+def _slotted_frame(fields):
+    """
+    Return a frame class with __slots__ for the given fields and 'state'.
+
+    The classes are cached, so each set of fields has a single class.
+    """
+    fields = tuple(fields)
+    try:
+        return _frame_classes[fields]
+    except KeyError:
+        pass
+
+    slots = ('state',) + tuple(name for name in fields if name != 'state')
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        """Set every field to None."""
+        for name in slots:
+            setattr(self, name, None)
+
+    def __copy__(self):
+        frame = cls.__new__(cls)
+        for name in slots:
+            setattr(frame, name, getattr(self, name))
+        return frame
+
+    cls = type('Frame', (), {'__slots__': slots,
+                             '__doc__': Frame.__doc__,
+                             '__init__': __init__,
+                             '_reset': _reset,
+                             '__copy__': __copy__})
+    _frame_classes[fields] = cls
+    return cls
+
+
+class _StackCell:
+    """
+    A cell of the frame stack.
+
+    The stack is a persistent linked list: cells are never modified, so any
+    number of stacks can share their lower cells, and a reference to the top
+    cell captures the whole stack.
+    """
+    __slots__ = ('frame', 'below', 'depth', 'size', 'epoch', 'memo')
+
+    def __init__(self, frame, below, epoch, memo=None):
+        self.frame = frame
+        self.below = below
+
+        # Depth and approximate bytes of the stack down from this cell.
+        size = sys.getsizeof(self) + sys.getsizeof(frame)
+        if hasattr(frame, '__dict__'):
+            size += sys.getsizeof(frame.__dict__)
+        if below == None:
+            self.depth = 1
+            self.size = size
+        else:
+            self.depth = below.depth + 1
+            self.size = below.size + size
+
+        # Snapshot epoch in which the frame was last writable.
+        self.epoch = epoch
+
+        # (packrat key, occurrence of the push) if the sub-parse started by
+        # the push is memoized.
+        self.memo = memo
+
+
+class StackStats:
+    """
+    Counters describing the memory used by the stack of a PushDown.
+
+    Frame sizes are measured when they are pushed, without following
+    references to other objects, so frame_bytes is a lower bound.
+
+    Attributes:
+        depth: Number of frames on the stack.
+        peak_depth: Greatest number of frames on the stack.
+        frame_bytes: Approximate memory of the frames on the stack, in bytes.
+        peak_bytes: Greatest frame_bytes.
+        overflows: Number of pushes refused for exceeding max_depth.
+    """
+    def __init__(self):
+        self.depth = 0
+        self.peak_depth = 0
+        self.frame_bytes = 0
+        self.peak_bytes = 0
+        self.overflows = 0
+
+    def sample(self):
+        """
+        Return a dictionary of the current values.
+        """
+        return {'depth': self.depth,
+                'peak_depth': self.peak_depth,
+                'frame_bytes': self.frame_bytes,
+                'peak_bytes': self.peak_bytes,
+                'overflows': self.overflows}
+
+    def __str__(self):
+        return 'stack depth: {} (peak {}), frame bytes: {} (peak {})'.format(
+            self.depth, self.peak_depth, self.frame_bytes, self.peak_bytes)
+
+
 class PushDown(sm.StateMachine):
     """
     Non-deterministic pushdown automata
+
+    The frames suspended by pushes are kept on a persistent stack, and frames
+    are copied on write, so mark_stack() snapshots the stack and the active
+    frame in constant time, and reset_stack() restores a snapshot just as
+    quickly.  Any number of snapshots share their frames and stack cells.
+    This lets Backtracking restore the stack when it backtracks, and makes
+    cheap checkpoints for error recovery.
+
+    After a snapshot the active frame is copied the first time active_frame
+    is accessed, so the snapshot keeps the original.  The copy is shallow, so
+    give frame attributes new values rather than modifying mutable values in
+    place, don't keep references to active_frame across transitions, and
+    treat the frames on the stack, such as top_frame, as read-only.  The
+    stack is only changed by push and pop states; stack_depth and top_frame
+    inspect it in constant time, and stack_snapshot() lists its frames.
+
+    Setting the frame_fields class attribute to a sequence of attribute names
+    makes frames instances of a class with __slots__ for those fields, which
+    saves memory and time for deeply nested input.  Popped frames that no
+    snapshot shares are then kept on a free list, up to frame_pool_size of
+    them, and reused by later pushes, with every field reset to None before
+    on_init_frame() is called.  So don't keep references to popped frames.
+
+    The frame discarded by the last pop is available as returned_frame,
+    until the next push, so a sub-parse can return results in its frame.
+
+    Setting packrat_size enables packrat memoization of sub-parses, for
+    recursive descent machines with Backtracking and an input tape.  The
+    sub-parse started by a push state at an input position runs until the
+    pop of its frame, and its outcome is remembered: whether it succeeded,
+    the position where it ended, and its returned_frame.  When the push
+    state is entered again at the same position, the outcome is replayed
+    rather than the sub-parse re-run, which makes the parse linear time.
+    At most packrat_size outcomes are remembered, the least recently used
+    being forgotten first, and a negative packrat_size means no limit.
+
+    Setting max_depth limits the number of frames on the stack, protecting
+    against input that nests without bound: a push beyond it raises
+    StackOverflow, which rejects the input.  The depth and approximate
+    memory of the stack, and their peaks, are kept in stack_stats, a
+    StackStats object.
+
+    Memoized sub-parses have the semantics of parsing expression grammars:
+    the first way a sub-parse succeeds is final, and backtracking never
+    returns into it for another.  A sub-parse entered again at the same
+    position before it ends, i.e. left recursion, fails.  Only the input
+    position and the frame are replayed, so sub-parses should depend on
+    nothing but the input, and return their results in their frames.
     """
+    frame_fields = None
+    frame_pool_size = 256
+    packrat_size = 0
+    max_depth = None
 
     def __init__(self, **kw_args):
         super().__init__(**kw_args)
 
-        self.stack = []
-        self._frame = Frame()
+        # Top cell of the frame stack, None if the stack is empty.
+        self._stack = None
+
+        # Snapshots taken so far, and the snapshot epoch in which the active
+        # frame was created or copied.  The active frame is shared with a
+        # snapshot unless the two are equal.
+        self._epoch = 0
+        self._frame_epoch = 0
+
+        self.stack_stats = StackStats()
+
+        # Popped frames for reuse, if frame_fields is set.
+        self._free_frames = []
+        self.returned_frame = None
+
+        # Packrat memo, least recently used first: (push state, input
+        # position) -> (end position, returned frame), or None for a
+        # sub-parse that failed or is still running.
+        self._packrat = OrderedDict()
+
+        self._frame = self._new_frame()
         self.on_init_frame(self._frame)
 
+    def stack_snapshot(self):
+        """
+        Return a tuple of the suspended frames, the top of the stack last.
+
+        This takes time proportional to the depth of the stack, so use
+        stack_depth, top_frame and stack_empty, which take constant time,
+        where they will do.  The stack itself can't be modified.
+        """
+        frames = []
+        cell = self._stack
+        while cell != None:
+            frames.append(cell.frame)
+            cell = cell.below
+        frames.reverse()
+        return tuple(frames)
+
+    @property
+    def stack_depth(self):
+        """
+        Return the number of frames on the stack.
+        """
+        if self._stack == None:
+            return 0
+        return self._stack.depth
+
     @property
     def top_frame(self):
         """
         Access the frame on the top of the stack.
 
         Raises:
-            IndexError: The stack is empty.
+            StateStackEmpty: The stack is empty.
         """
         if self.stack_empty: raise StateStackEmpty()
-        return self.stack[-1]
+        return self._stack.frame
 
     @property
     def active_frame(self):
         """
-        Access the active frame.
+        Access the active frame, copying it first if a snapshot shares it.
         """
+        if self._frame_epoch != self._epoch:
+            self._frame = copy.copy(self._frame)
+            self._frame_epoch = self._epoch
         return self._frame
 
     @property
@@ -81,7 +293,56 @@ class PushDown(sm.StateMachine):
         """
         Return whether the stack is empty or not.
         """
-        return len(self.stack) == 0
+        return self._stack == None
+
+    def mark_stack(self):
+        """
+        Return a snapshot of the stack and active frame.
+
+        This takes constant time, whatever the depth of the stack.  The
+        snapshot can be restored by reset_stack() any number of times.
+        """
+        self._epoch += 1
+        return (self._stack, self._frame)
+
+    def reset_stack(self, mark):
+        """
+        Restore the stack and active frame from a mark_stack() snapshot.
+        """
+        self._stack, self._frame = mark
+
+        # The snapshot still holds the frame.
+        self._frame_epoch = -1
+        self._update_stack_stats()
+
+    def _update_stack_stats(self):
+        """Update stack_stats after the stack has changed."""
+        stats = self.stack_stats
+        cell = self._stack
+        if cell == None:
+            stats.depth = 0
+            stats.frame_bytes = 0
+            return
+
+        stats.depth = cell.depth
+        stats.frame_bytes = cell.size
+        if cell.depth > stats.peak_depth:
+            stats.peak_depth = cell.depth
+        if cell.size > stats.peak_bytes:
+            stats.peak_bytes = cell.size
+
+    def _new_frame(self):
+        """
+        Return a frame for a push, from the free list if possible.
+        """
+        if self.frame_fields == None:
+            return Frame()
+
+        if self._free_frames:
+            frame = self._free_frames.pop()
+            frame._reset()
+            return frame
+        return _slotted_frame(self.frame_fields)()
 
     def add_state(self, s_name, resume=None, pop=False, **kw_args):
         """
@@ -174,21 +435,29 @@ class PushDown(sm.StateMachine):
         """
         pass
 
-    def _push(self):
+    def _push(self, memo=None):
         """
         Push the current state onto the stack and enter a new state.
 
         Args:
-            next_state: Initial state of the new stack frame.
+            memo: (packrat key, occurrence) if the sub-parse is memoized.
 
         Raises:
             KeyError if next_state is not a known state name.
+            StackOverflow: The stack already holds max_depth frames.
 
         """
+        if self.max_depth != None and self.stack_depth >= self.max_depth:
+            self.stack_stats.overflows += 1
+            raise StackOverflow("State stack is deeper than {md} frames."\
+                                .format(md=self.max_depth))
 
         self._suspend()
-        self.stack.append(self._frame)
-        self._frame = Frame()
+        self._stack = _StackCell(self._frame, self._stack, self._frame_epoch,
+                                 memo)
+        self._update_stack_stats()
+        self._frame = self._new_frame()
+        self._frame_epoch = self._epoch
         self.on_init_frame(self._frame)
         self._frame.state = None
 
@@ -199,10 +468,72 @@ class PushDown(sm.StateMachine):
 
         if self.stack_empty: raise StateStackEmpty()
         self._exit()
-        self._frame = self.stack.pop()
+
+        cell = self._stack
+        self.returned_frame = self._frame
+        if cell.memo != None:
+            self._memoize_success(*cell.memo)
+
+        # The frame being discarded can be reused, unless a snapshot or the
+        # packrat memo has it.
+        elif self.frame_fields != None and self._frame_epoch == self._epoch \
+                and len(self._free_frames) < self.frame_pool_size:
+            self._free_frames.append(self._frame)
+
+        self._stack = cell.below
+        self._update_stack_stats()
+        self._frame = cell.frame
+        self._frame_epoch = cell.epoch
         self._current_state = self._frame.state
         self._resume()
 
+    def _remember(self, key, outcome):
+        """Add a sub-parse outcome to the packrat memo."""
+        self._packrat[key] = outcome
+        self._packrat.move_to_end(key)
+        if 0 <= self.packrat_size < len(self._packrat):
+            self._packrat.popitem(last=False)
+
+    def _packrat_push(self):
+        """
+        Push, starting a memoized sub-parse, or replay a memoized outcome.
+
+        Returns:
+            True if an outcome was replayed, so the transition is done.
+
+        Raises:
+            Backtrack: The sub-parse is known to fail.
+        """
+        key = (self.current_state, self.pos)
+        if key not in self._packrat:
+            self._remember(key, None)
+            occ = self.track.last() if hasattr(self, 'cut') else None
+            self._push((key, occ))
+            return False
+
+        self._packrat.move_to_end(key)
+        outcome = self._packrat[key]
+        if outcome == None:
+            raise Backtrack()
+
+        end, frame = outcome
+        while self.pos < end:
+            self.advance()
+        self._exit()
+        self.returned_frame = frame
+        self._resume()
+        return True
+
+    def _memoize_success(self, key, occ):
+        """
+        Record a sub-parse ending with the current pop, and commit to it.
+        """
+        if self._packrat.get(key) == None:
+            self._remember(key, (self.pos, self._frame))
+        if occ != None:
+            # Later paths replay the memo, so don't search for another way.
+            self.cut(occ)
+
     def _transition(self):
         """
         Handle the details of transitioning.
@@ -211,8 +542,14 @@ class PushDown(sm.StateMachine):
         """
         state_dict = super().state_dict(self.current_state)
         try:
-            if state_dict['_push_state']:
-                self._push()
+            # The transition may be retried, e.g. by FeedTape when it runs out
+            # of input, so don't push if the push already happened.
+            if state_dict['_push_state'] and \
+                    self._frame.state == self.current_state:
+                if not self.packrat_size:
+                    self._push()
+                elif self._packrat_push():
+                    return
         except KeyError:
             pass
 
@@ -226,7 +563,7 @@ class PushDown(sm.StateMachine):
         super()._transition()
 
     def accept_test(self):
-        if len(self.stack) > 0:
+        if not self.stack_empty:
             return False
         return super().accept_test()
 
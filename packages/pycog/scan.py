@@ -0,0 +1,97 @@
+"""Scanning an input tape for matches of a state machine"""
+
+from pycog.exceptions import Accept, Reject
+
+class Scanning:
+    """
+    Mix-in to find every match of a state machine in a single input tape.
+
+    finditer() runs the state machine from successive positions of the tape.
+    Each run records the last time the machine was in an accepting state with
+    its activity complete, so the longest match from the start position is
+    found.  Raising Accept also ends the match at the current position.  After
+    a match, scanning restarts at its end; otherwise it restarts one symbol
+    after the previous start.  So matches are leftmost-longest and don't
+    overlap, and empty matches are not reported.
+
+    The input tape must support marks, e.g. InputTape.  The stream is only
+    read once: the input is retained for as long as the current attempt needs
+    it, not for the whole scan.
+
+    Override on_scan_start() to reset the machine's data for each attempt.
+    """
+    def __init__(self, **kw_args):
+        super().__init__(**kw_args)
+
+        # (tape mark, state name) at the end of the longest match so far.
+        self._scan_match = None
+
+    def finditer(self):
+        """
+        Generate the matches in the input tape.
+
+        Yields:
+            (start, end, s_name) for each match, where start and end are tape
+            positions, and s_name is the accepting state that ended the match.
+        """
+        while True:
+            start = self.pos
+            start_mark = self.mark()
+
+            self._scan_match = None
+            self.current_state = self._initial
+            self.on_scan_start(start)
+            try:
+                self._run()
+            except Accept:
+                self._record_match()
+            except Reject:
+                pass
+
+            match = self._scan_match
+            self._scan_match = None
+            if match != None:
+                end_mark, s_name = match
+                self.reset_to(end_mark)
+                self.release(end_mark)
+            else:
+                self.reset_to(start_mark)
+
+            self.release(start_mark)
+
+            if match != None and self.pos > start:
+                yield start, self.pos, s_name
+            elif self.symbol == self.eof:
+                return
+            else:
+                self.advance()
+
+    def on_scan_start(self, pos):
+        """
+        Notification that a match is about to be attempted.
+
+        Args:
+            pos: Tape position where the attempt starts.
+
+        Derived classes implementing this handler should call
+        super().on_scan_start().
+        """
+        pass
+
+    def _record_match(self):
+        """Record the current position as the end of the longest match."""
+        if self._scan_match != None:
+            self.release(self._scan_match[0])
+        self._scan_match = (self.mark(), self.current_state)
+
+    def on_pre_select_transition(self, s_name, candidate_s_names):
+        """
+        Handle pre_select_transition notifications.
+
+        The activity of s_name is complete, so if it's an accepting state the
+        input so far is a match.
+        """
+        if self.accepting:
+            self._record_match()
+
+        super().on_pre_select_transition(s_name, candidate_s_names)
@@ -0,0 +1,371 @@
+"""Search strategies for state machines"""
+
+import copy
+import heapq
+import itertools
+import random
+
+from pycog.statemachine import StateMachine
+from pycog.backtrack import Backtracking
+from pycog.exceptions import Accept, Reject, Backtrack
+
+def _check_precedes_backtracking(fsm, mix_in):
+    """
+    Check that a mix-in modifying Backtracking precedes it in the mro.
+    """
+    mro = type(fsm).mro()
+    try:
+        if mro.index(mix_in) > mro.index(Backtracking):
+            raise ValueError()
+    except ValueError:
+        raise TypeError("Class '{mi}' modifies class 'Backtracking', and "\
+                        "must precede it in the mro.".format(
+                            mi=mix_in.__name__))
+
+def luby(i):
+    """
+    Return the i'th term of the Luby sequence, 1, 1, 2, 1, 1, 2, 4, 1, ...
+
+    Args:
+        i: Index of the term, starting from 1.
+    """
+    while True:
+        k = i.bit_length()
+        if i == (1 << k) - 1:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+
+def luby_schedule(scale=32):
+    """
+    Generate restart limits following the Luby sequence.
+
+    Args:
+        scale: Multiplier for the terms of the sequence.
+    """
+    for i in itertools.count(1):
+        yield scale*luby(i)
+
+def geometric_schedule(scale=32, factor=1.5):
+    """
+    Generate restart limits growing geometrically.
+
+    Args:
+        scale: The first limit.
+        factor: Ratio between successive limits.
+    """
+    limit = scale
+    while True:
+        yield int(limit)
+        limit *= factor
+
+class BestFirst:
+    """
+    Mix-in to search the transitions of a state machine best-first.
+
+    Rather than following one transition at a time and backtracking, every
+    allowed transition is followed, and each resulting configuration (a state
+    after its activity, with a snapshot of the application data) is put in a
+    priority queue.  The search always continues from the open configuration
+    with the lowest priority(), jumping between branches by restoring
+    snapshots.
+
+    priority() defaults to cost() + heuristic(), which gives A* search, or
+    uniform cost search with the default heuristic() of 0.  Override
+    priority() to return heuristic() for greedy best-first search.  As long as
+    heuristic() never overestimates the remaining cost, the first accepted
+    configuration is optimal.
+
+    If beam_width is positive, only the best beam_width open configurations
+    are kept after each expansion, giving beam search.
+
+    A configuration is accepted if its activity raises Accept, or if it has no
+    transitions and its state is accepting.  Accepted configurations are
+    queued like any other, and the search stops when one is reached.  Raising
+    Backtrack in an activity discards the configuration.
+
+    snapshot() and restore() save and restore application data.  By default
+    they deep copy the attributes named in snapshot_attrs.
+
+    BestFirst and Backtracking are alternative search strategies, and should
+    not be combined.
+    """
+    snapshot_attrs = ()
+
+    def __init__(self, beam_width=-1, **kw_args):
+        super().__init__(**kw_args)
+
+        self.beam_width = beam_width
+
+        # Heap of (priority, count, state, snapshot, accept exception).  The
+        # count breaks ties in first in, first out order.
+        self._open = []
+        self._open_count = itertools.count()
+
+        if __debug__:
+            mro = type(self).mro()
+            try:
+                fsm_index = mro.index(StateMachine)
+                if mro.index(BestFirst) > fsm_index:
+                    raise ValueError()
+            except ValueError:
+                raise TypeError("Class 'BestFirst' modifies class " \
+                                "'StateMachine', and must precede it in the " \
+                                "mro.")
+
+    def cost(self):
+        """
+        Return the cost of the path to the current configuration.
+        """
+        return 0
+
+    def heuristic(self):
+        """
+        Return an estimate of the cost from the current configuration to an
+        accepted one.
+        """
+        return 0
+
+    def priority(self):
+        """
+        Return the priority of the current configuration, lowest first.
+        """
+        return self.cost() + self.heuristic()
+
+    def snapshot(self):
+        """
+        Return a copy of the application data.
+        """
+        return copy.deepcopy(dict((name, getattr(self, name))
+                                  for name in self.snapshot_attrs))
+
+    def restore(self, snapshot):
+        """
+        Restore the application data from a snapshot.
+
+        A snapshot may be restored any number of times, so it must not be
+        modified.
+        """
+        for name, value in copy.deepcopy(snapshot).items():
+            setattr(self, name, value)
+
+    def _queue(self):
+        """
+        Run the current state's activity, and queue the configuration.
+        """
+        accept = None
+        try:
+            self._do_activity()
+        except Backtrack:
+            return
+        except Accept as exc:
+            accept = exc
+
+        heapq.heappush(self._open, (self.priority(), next(self._open_count),
+                                    self.current_state, self.snapshot(),
+                                    accept))
+
+    def _run(self):
+        """
+        Search best-first until a configuration is accepted.
+        """
+        assert self._current_state, "Initial state not set."
+        self._open = []
+        self._enter()
+        self._queue()
+
+        while self._open:
+            priority, count, s_name, snapshot, accept = \
+                    heapq.heappop(self._open)
+            self.current_state = s_name
+            self.restore(snapshot)
+            if accept != None:
+                raise accept
+
+            allowed_transitions = self._allowed_transitions()
+            self.on_pre_select_transition(s_name, allowed_transitions)
+            if len(allowed_transitions) == 0:
+                if self.accepting:
+                    raise Accept()
+                continue
+
+            self._exit()
+            for index, next_state in enumerate(allowed_transitions):
+                if index > 0:
+                    self.current_state = s_name
+                    self.restore(snapshot)
+                self.on_transition(s_name, next_state)
+                self._do_transition(next_state)
+                self._queue()
+
+            if 0 < self.beam_width < len(self._open):
+                # A sorted list is a valid heap.
+                self._open = heapq.nsmallest(self.beam_width, self._open)
+
+        raise Reject("Search exhausted.")
+
+
+class RandomRestarts:
+    """
+    Mix-in randomizing the order of candidate transitions for Backtracking,
+    and restarting the search when it fails too often.
+
+    Each time a state's transitions are selected their order is shuffled.
+    The search is restarted from the initial state each time it has reached a
+    number of dead ends, taken in turn from the schedule, e.g. luby_schedule()
+    or geometric_schedule().  The limits grow, so the search stays complete.
+
+    Everything is reproducible from the seed.
+
+    Since a restart forgets which subtrees were explored, solutions() may
+    report a solution more than once.  Restarts are best suited to finding one
+    solution, or to branch-and-bound, where the incumbent survives restarts.
+
+    RandomRestarts must precede Backtracking in the mro.
+
+    Attributes:
+        random: The random.Random instance used for shuffling.
+        restarts: Number of restarts so far.
+    """
+    def __init__(self, seed=None, schedule=None, **kw_args):
+        super().__init__(**kw_args)
+
+        self.random = random.Random(seed)
+        if schedule == None:
+            schedule = luby_schedule()
+        self.schedule = iter(schedule)
+        self.restarts = 0
+
+        self._fail_limit = next(self.schedule)
+        self._fails = 0
+
+        if __debug__:
+            _check_precedes_backtracking(self, RandomRestarts)
+
+    def _shuffled(self, transitions):
+        """Return a list of the transitions in random order."""
+        transitions = list(transitions)
+        self.random.shuffle(transitions)
+        return transitions
+
+    def _transition_multiple(self, allowed_transitions):
+        """
+        Transition, trying the candidates in random order.
+        """
+        super()._transition_multiple(self._shuffled(allowed_transitions))
+
+    def _continue_search(self):
+        """
+        Backtrack after a dead end, or restart if there have been too many.
+        """
+        self._fails += 1
+        if self._fails >= self._fail_limit and len(self.track) > 1:
+            self._restart()
+        super()._continue_search()
+
+    def _restart(self):
+        """
+        Backtrack to the initial state, and reshuffle its transitions.
+        """
+        self.restarts += 1
+        self._fails = 0
+        self._fail_limit = next(self.schedule)
+
+        self._unwind(1)
+        root = self.track.last()
+        root.set_transitions(self._shuffled(root.candidates))
+
+class LimitedDiscrepancy:
+    """
+    Mix-in for limited discrepancy search with Backtracking.
+
+    Taking any but the first candidate transition of a state is a
+    discrepancy, a departure from the order of the candidates.  The search is
+    run in iterations, the first allowing no discrepancies along a path, and
+    each following one allowing one more, so paths close to the preferred
+    order are tried first.  The iterations stop when one of them explores the
+    whole search tree, or when max_discrepancies have been allowed.
+
+    Each iteration repeats the paths of the previous ones, so solutions() may
+    report a solution more than once.  The transposition table is only
+    updated for subtrees explored in full.
+
+    LimitedDiscrepancy must precede Backtracking in the mro.
+
+    Attributes:
+        discrepancy_limit: Discrepancies allowed in the current iteration.
+        max_discrepancies: The greatest discrepancy_limit, or None for no
+            limit.
+    """
+    def __init__(self, max_discrepancies=None, **kw_args):
+        super().__init__(**kw_args)
+
+        self.discrepancy_limit = 0
+        self.max_discrepancies = max_discrepancies
+
+        # Whether a path has been cut short in this iteration.
+        self._cut = False
+
+        # Candidate transitions of the initial state.
+        self._root_candidates = None
+
+        if __debug__:
+            _check_precedes_backtracking(self, LimitedDiscrepancy)
+
+    def make_occurrence(self):
+        """
+        Create an occurrence, counting the discrepancies on its path.
+        """
+        occ = super().make_occurrence()
+        occ.taken = 0
+        occ.discrepancies = 0
+
+        occurrences = self.track.occurrences
+        if occurrences:
+            parent = occurrences[-1]
+            occ.discrepancies = parent.discrepancies
+            if parent.taken > 1:
+                occ.discrepancies += 1
+        return occ
+
+    def on_pre_select_transition(self, s_name, allowed_transitions):
+        """
+        Keep the initial state's candidates for the following iterations.
+        """
+        super().on_pre_select_transition(s_name, allowed_transitions)
+        if self._root_candidates == None and len(self.track) == 1:
+            self._root_candidates = tuple(allowed_transitions)
+
+    def on_transition(self, exiting, entering):
+        """
+        Count the transitions taken from the current occurrence.
+        """
+        self.track.last().taken += 1
+        super().on_transition(exiting, entering)
+
+    def _resume_transitions(self, occ):
+        """
+        Resume only within the discrepancy limit, starting the next iteration
+        when the initial state is reached.
+        """
+        resume = super()._resume_transitions(occ)
+        if resume and occ.discrepancies >= self.discrepancy_limit:
+            self._cut = True
+            resume = False
+
+        if not resume and len(self.track) == 1 and self._cut:
+            if self.max_discrepancies == None or \
+                    self.discrepancy_limit < self.max_discrepancies:
+                self.discrepancy_limit += 1
+                self._cut = False
+                occ.taken = 0
+                occ.set_transitions(self._root_candidates)
+                resume = super()._resume_transitions(occ)
+
+        return resume
+
+    def _remember_exhausted(self, occ):
+        """
+        Only remember occurrences whose subtrees weren't cut short.
+        """
+        if not self._cut:
+            super()._remember_exhausted(occ)
@@ -2,7 +2,7 @@
 
 import inspect
 
-from pycog.exceptions import Accept, Reject, Backtrack
+from pycog.exceptions import Accept, Reject
 
 class _StateRecord:
     """Information about a state."""
@@ -398,15 +398,15 @@ class StateMachine:
 
         self._do_transition(next_state)
 
-    def _transition(self):
+    def _allowed_transitions(self):
         """
-        Handle the details of transitioning.
+        List the transitions from the current state that pass their transition
+        tests and the guards of their target states.
 
         For internal use.
         """
         record = self._state_records[self.current_state]
 
-        # Transitioning
         allowed_transitions = []
         for next_trans in record.transitions:
             if record.transition_info[next_trans].test(self,
@@ -416,6 +416,16 @@ class StateMachine:
                 if next_record.guard(self):
                     allowed_transitions.append(next_trans)
 
+        return allowed_transitions
+
+    def _transition(self):
+        """
+        Handle the details of transitioning.
+
+        For internal use.
+        """
+        allowed_transitions = self._allowed_transitions()
+
         self._exit()
 
         self._transition_multiple(allowed_transitions)
@@ -433,6 +443,15 @@ class StateMachine:
 
             activity(self)
 
+    def _step(self):
+        """
+        Run the activity of the current state, then transition.
+
+        For internal use.
+        """
+        self._do_activity()
+        self._transition()
+
     def _run(self):
         """
         Helper function for run.
@@ -443,16 +462,7 @@ class StateMachine:
         assert self._current_state, "Initial state not set."
         self._enter()
         while True:
-            try:
-                self._do_activity()
-                self._transition()
-
-            except Backtrack:
-                # TODO: Handle this without referencing backtracking.
-                if not self._backtrack():
-                    self.on_exhausted()
-
-                    raise Reject("Backtracking exhausted.")
+            self._step()
 
     def run(self):
         """Run the state machine"""
@@ -38,7 +38,7 @@ class TreeDumper(PushDown):
     @state("write", transitions=[('children', transition_always)])
     def write(self):
         indent_str = ""
-        for frame in self.stack:
+        for frame in self.stack_snapshot():
             if frame.children:
                 if frame == self.top_frame:
                     indent_str += "|--"
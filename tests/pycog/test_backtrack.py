@@ -0,0 +1,454 @@
+"""Test pycog.backtrack"""
+
+import sys
+import os.path as op
+
+# Need this so we pick up the code base for which this is a test, not an
+# installed version.
+package_dir = op.abspath(op.join('..', 'packages'))
+if package_dir not in sys.path:
+    sys.path.insert(0, package_dir)
+
+example_dir = op.abspath(op.join('..', 'examples'))
+if example_dir not in sys.path:
+    sys.path.insert(0, example_dir)
+
+import unittest
+import itertools
+from io import StringIO
+
+from pycog.statemachine import *
+from pycog.exceptions import *
+from pycog.backtrack import *
+from pycog.inputtape import *
+
+from min_change import MinimalChange
+from eight_queens import EightQueens
+
+class GuessEnding(Backtracking, InputTape, StateMachine):
+    """
+    Accept a b* c or a b* d, guessing the last symbol before reading.
+
+    A wrong guess is only discovered after the b's are read, so the tape must
+    be rewound when backtracking to the other guess.
+    """
+    def __init__(self, stream):
+        super().__init__(initial='init', stream=stream)
+
+    @state('init', transitions=['c', 'd'])
+    def init(self):
+        pass
+
+    @state('c', transitions=['final'])
+    def c(self):
+        self.read_word('c')
+
+    @state('d', transitions=['final'])
+    def d(self):
+        self.read_word('d')
+
+    def read_word(self, last):
+        if self.symbol != 'a':
+            raise Backtrack()
+        self.advance()
+        while self.symbol == 'b':
+            self.advance()
+        if self.symbol != last:
+            raise Backtrack()
+        self.advance()
+
+    @state('final', accepting=True)
+    def final(self):
+        pass
+    @final.guard
+    def final(self):
+        return self.symbol == ''
+
+class TrackTest(unittest.TestCase):
+    def test_occurrence(self):
+        occ = StateOccurrence('s')
+        occ.set_transitions(['a', 'b', 'c'])
+        occ.remove_transition('a')
+        self.assertEqual(occ.transitions, ('b', 'c'))
+        occ.remove_transition('c')
+        self.assertEqual(occ.transitions, ('b',))
+        self.assertEqual(occ.remaining, 1)
+
+    def test_max_occ(self):
+        track = Track(2)
+        self.assertEqual(track.append(StateOccurrence('a')), ())
+        self.assertEqual(track.append(StateOccurrence('b')), ())
+        dropped = track.append(StateOccurrence('c'))
+        self.assertEqual([occ.state for occ in dropped], ['a'])
+        self.assertEqual([occ.state for occ in track], ['b', 'c'])
+        self.assertEqual(str(track), 'b -(1)-> c')
+
+class TrailTest(unittest.TestCase):
+    def test_set(self):
+        class Data:
+            pass
+        data = Data()
+        trail = Trail()
+        data.a = 1
+
+        mark = trail.mark()
+        trail.set(data, 'a', 2)
+        trail.set(data, 'b', 3)
+        trail.set(data, 'a', 4)
+        self.assertEqual((data.a, data.b), (4, 3))
+
+        trail.undo_to(mark)
+        self.assertEqual(data.a, 1)
+        self.assertFalse(hasattr(data, 'b'))
+        self.assertEqual(len(trail), 0)
+
+    def test_containers(self):
+        trail = Trail()
+        items = TrailedSet(trail, [1, 2])
+        table = TrailedDict(trail, a=1)
+
+        mark = trail.mark()
+        items.add(3)
+        items.discard(1)
+        items.add(2)
+        table['a'] = 2
+        table['b'] = 3
+        del table['a']
+        self.assertEqual(set(items), {2, 3})
+        self.assertEqual(dict(table), {'b': 3})
+
+        trail.undo_to(mark)
+        self.assertEqual(set(items), {1, 2})
+        self.assertEqual(dict(table), {'a': 1})
+
+    def test_forget(self):
+        trail = Trail()
+        items = TrailedSet(trail)
+        items.add(1)
+        mark = trail.mark()
+        items.add(2)
+        trail.forget_to(mark)
+        self.assertEqual(len(trail), 1)
+        self.assertEqual(trail.mark(), mark + 1)
+
+        trail.undo_to(mark)
+        self.assertEqual(set(items), {1})
+
+    def test_search(self):
+        fsm = MinimalChange(35, [1, 3, 5, 7, 11, 13])
+        fsm.run()
+        self.assertEqual((fsm.num_coins, fsm.accumulated), (0, 0))
+        self.assertEqual(sum(fsm.coins.values()), 0)
+        self.assertEqual(len(fsm.trail), 0)
+
+class TapeBacktrackTest(unittest.TestCase):
+    def test_rewind(self):
+        self.assertTrue(GuessEnding(StringIO("abbbc")).run())
+        self.assertTrue(GuessEnding(StringIO("abbbd")).run())
+        self.assertFalse(GuessEnding(StringIO("abbbe")).run())
+        self.assertFalse(GuessEnding(StringIO("abbbdd")).run())
+
+    def test_resume(self):
+        # Resuming the initial state takes its next candidate without
+        # copying them.
+        class Resumed(GuessEnding):
+            def on_transition(self, exiting, entering):
+                if exiting == 'init':
+                    seen.append(self.track.last().candidates)
+                super().on_transition(exiting, entering)
+
+        seen = []
+        self.assertTrue(Resumed(StringIO("abbbd")).run())
+        self.assertEqual(len(seen), 2)
+        self.assertIs(seen[0], seen[1])
+
+    def test_marks(self):
+        tape = InputTape(stream=StringIO("abcdef"))
+        tape.advance()
+        first = tape.mark()
+        tape.advance()
+        second = tape.mark()
+        tape.advance()
+        tape.advance()
+        self.assertEqual(tape.symbol, 'e')
+
+        tape.reset_to(first)
+        self.assertEqual((tape.pos, tape.symbol), (1, 'b'))
+        self.assertEqual(tape.advance(), 'c')
+
+        # Releasing the oldest mark drops the input before the current
+        # position.
+        tape.release(first)
+        tape.release(second)
+        self.assertEqual(tape.advance(), 'd')
+        self.assertEqual(tape.advance(), 'e')
+        self.assertEqual(tape.advance(), 'f')
+        self.assertEqual(tape.advance(), '')
+        self.assertEqual(len(tape._buffer), 0)
+
+class CountingChange(MinimalChange):
+    """MinimalChange, counting the states entered."""
+    def __init__(self, *args, **kw_args):
+        self.entered = 0
+        super().__init__(*args, **kw_args)
+
+    def on_enter_state(self, s_name):
+        self.entered += 1
+        super().on_enter_state(s_name)
+
+    def lower_bound(self, s_name):
+        # A weak bound, leaving work for the transposition table.
+        if s_name == 'final':
+            return self.num_coins
+        return self.num_coins + 1
+
+class UnmemoizedChange(CountingChange):
+    """CountingChange without the transposition table."""
+    def signature(self):
+        return None
+
+class BranchAndBoundChange(CountingChange):
+    """CountingChange with MinimalChange's own lower bound."""
+    lower_bound = MinimalChange.lower_bound
+
+class TranspositionTest(unittest.TestCase):
+    def test_min_change(self):
+        memoized = CountingChange(97, [1, 3, 5, 7, 11, 13])
+        memoized.run()
+        unmemoized = UnmemoizedChange(97, [1, 3, 5, 7, 11, 13])
+        unmemoized.run()
+
+        self.assertEqual(memoized.fewest, unmemoized.fewest)
+        self.assertEqual(memoized.fewest, 9)
+        self.assertLess(memoized.entered, unmemoized.entered/2)
+
+    def test_memo_size(self):
+        fsm = CountingChange(63, [1, 3, 5, 7, 11, 13])
+        fsm.memo_size = 10
+        fsm.run()
+        self.assertEqual(fsm.fewest, 5)
+        self.assertEqual(len(fsm._exhausted_signatures), 10)
+
+class BranchAndBoundTest(unittest.TestCase):
+    def test_incumbent(self):
+        fsm = BranchAndBoundChange(35, [1, 3, 5, 7, 11, 13])
+        self.assertTrue(fsm.run())
+        self.assertEqual(fsm.incumbent_value, 3)
+        self.assertEqual(fsm.incumbent[11], 2)
+        self.assertEqual(fsm.incumbent[13], 1)
+
+    def test_lower_bound(self):
+        weak = CountingChange(97, [1, 3, 5, 7, 11, 13])
+        weak.run()
+        strong = BranchAndBoundChange(97, [1, 3, 5, 7, 11, 13])
+        strong.run()
+
+        self.assertEqual(weak.incumbent_value, strong.incumbent_value)
+        self.assertLess(strong.entered, weak.entered/2)
+
+    def test_run_all(self):
+        values = []
+        fsm = BranchAndBoundChange(35, [1, 3, 5, 7, 11, 13])
+        def improved(coins):
+            values.append(sum(coins.values()))
+        self.assertFalse(fsm.run_all(improved))
+        self.assertEqual(values, sorted(values, reverse=True))
+        self.assertEqual(len(set(values)), len(values))
+        self.assertEqual(values[-1], 3)
+
+class EnumeratedChange(MinimalChange):
+    """MinimalChange generating every way of making change."""
+    def objective(self):
+        return None
+
+    def lower_bound(self, s_name):
+        return None
+
+class UnmemoizedEnumeratedChange(EnumeratedChange):
+    """EnumeratedChange without the transposition table."""
+    def signature(self):
+        return None
+
+class SolutionsTest(unittest.TestCase):
+    def test_suspended(self):
+        fsm = EightQueens()
+        solutions = fsm.solutions()
+
+        path = next(solutions)
+        self.assertEqual(len(fsm.track), 10)
+        self.assertEqual(path, fsm.solution())
+        self.assertEqual(set(path[1:-1]), fsm.queens)
+
+        # Only half the solutions, by symmetry.
+        self.assertEqual(sum(1 for path in solutions), 45)
+
+    def test_stop_early(self):
+        fsm = EightQueens()
+        solutions = fsm.solutions()
+        paths = list(itertools.islice(solutions, 3))
+        self.assertEqual(len(set(paths)), 3)
+
+        solutions.close()
+        self.assertFalse(fsm._enumerating)
+
+    def test_memoized(self):
+        # Occurrences whose subtrees generated solutions aren't memoized.
+        memoized = EnumeratedChange(19, [1, 3, 5, 7, 11, 13])
+        unmemoized = UnmemoizedEnumeratedChange(19, [1, 3, 5, 7, 11, 13])
+        solutions = list(memoized.solutions())
+        self.assertEqual(len(solutions), 40)
+        self.assertEqual(sorted(map(sorted, map(dict.items, solutions))),
+                         sorted(map(sorted, map(dict.items,
+                                                unmemoized.solutions()))))
+
+class DeepChain(Backtracking, StateMachine):
+    """
+    A chain of states much longer than the recursion limit, ending in a dead
+    end, beside a one step path to the goal.
+    """
+    def __init__(self, length, goal=True):
+        super().__init__()
+        self.add_state('init')
+        self.set_initial_state('init')
+        self.add_state('goal', accepting=True)
+
+        self.add_transition('init', 0)
+        if goal:
+            self.add_transition('init', 'goal')
+        for link in range(length):
+            self.add_state(link)
+            if link > 0:
+                self.add_transition(link - 1, link)
+
+class LastFirst(Backtracking, StateMachine):
+    """
+    Dead ends a, b and c, selected last candidate first.
+    """
+    def __init__(self):
+        super().__init__()
+        self.visited = []
+        self.add_state('init')
+        self.set_initial_state('init')
+        for s_name in ['a', 'b', 'c']:
+            self.add_state(s_name, activity=LastFirst.dead_end)
+            self.add_transition('init', s_name)
+
+    def dead_end(self):
+        self.visited.append(self.current_state)
+        raise Backtrack()
+
+    def select_transition(self, s_name, candidate_s_names):
+        return candidate_s_names[-1]
+
+class SelectTransitionTest(unittest.TestCase):
+    def test_order(self):
+        # The remaining candidates are selected from again on backtracking.
+        fsm = LastFirst()
+        self.assertFalse(fsm.run())
+        self.assertEqual(fsm.visited, ['c', 'b', 'a'])
+
+class DeepSearchTest(unittest.TestCase):
+    def test_deep_dead_end(self):
+        length = 10*sys.getrecursionlimit()
+        fsm = DeepChain(length)
+        self.assertTrue(fsm.run())
+        self.assertEqual(fsm.current_state, 'goal')
+        self.assertEqual(len(fsm.track), 2)
+
+    def test_deep_exhausted(self):
+        length = 10*sys.getrecursionlimit()
+        fsm = DeepChain(length, goal=False)
+        self.assertFalse(fsm.run())
+        self.assertEqual(len(fsm.track), 0)
+
+class StatsTest(unittest.TestCase):
+    def test_counters(self):
+        fsm = DeepChain(3)
+        fsm.stats_interval = 2
+        self.assertTrue(fsm.run())
+
+        stats = fsm.stats
+        self.assertEqual(stats.nodes, 5)
+        self.assertEqual(stats.backtracks, 3)
+        self.assertEqual(stats.max_depth, 4)
+        self.assertEqual(stats.mean_depth, 2.4)
+        self.assertEqual(stats.dead_ends, {2: 1})
+        self.assertEqual(stats.fan_out, {0: 2, 1: 2, 2: 1})
+        self.assertEqual([sample['nodes'] for sample in stats.samples],
+                         [2, 4])
+        self.assertIn('backtracks: 3', str(stats))
+
+class ForwardCheckingTest(unittest.TestCase):
+    def test_domains(self):
+        trail = Trail()
+        domains = Domains(trail)
+        domains.define('x', [1, 2])
+        self.assertTrue(domains.allows('x', 1))
+        self.assertTrue(domains.allows('y', 1))
+
+        mark = trail.mark()
+        domains.remove('x', 1)
+        self.assertFalse(domains.allows('x', 1))
+        with self.assertRaises(Backtrack):
+            domains.remove('x', 2)
+
+        trail.undo_to(mark)
+        self.assertEqual(set(domains['x']), {1, 2})
+
+    def test_eight_queens(self):
+        fsm = EightQueens()
+        self.assertTrue(fsm.run())
+
+        rows = set(row for row, col in fsm.queens)
+        diagonals = set(row - col for row, col in fsm.queens)
+        anti_diagonals = set(row + col for row, col in fsm.queens)
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(len(diagonals), 8)
+        self.assertEqual(len(anti_diagonals), 8)
+
+        # Propagation finds dead ends before a square runs out of candidates.
+        self.assertNotIn(0, fsm.stats.fan_out)
+
+class Mirrored(Backtracking, StateMachine):
+    """
+    Two mirror image chains of states, ('a', i) and ('b', i), both ending in
+    a dead end.
+    """
+    def __init__(self, length):
+        super().__init__()
+        self.add_state('init')
+        self.set_initial_state('init')
+        for side in 'ab':
+            self.add_transition('init', (side, 0))
+            for link in range(length):
+                self.add_state((side, link))
+                if link > 0:
+                    self.add_transition((side, link - 1), (side, link))
+
+    def signature(self):
+        return self.current_state
+
+class SymmetryTest(unittest.TestCase):
+    def test_lex_leader(self):
+        fsm = EightQueens()
+        self.assertEqual(sum(1 for path in fsm.solutions()), 46)
+
+        fsm = EightQueens()
+        fsm._symmetries.clear()
+        self.assertEqual(sum(1 for path in fsm.solutions()), 92)
+
+    def test_signature(self):
+        def mirror(sig):
+            if sig == 'init':
+                return sig
+            side, link = sig
+            return 'b' if side == 'a' else 'a', link
+
+        plain = Mirrored(10)
+        self.assertFalse(plain.run())
+        self.assertEqual(plain.stats.nodes, 21)
+
+        symmetric = Mirrored(10)
+        symmetric.add_signature_symmetry(mirror)
+        self.assertFalse(symmetric.run())
+        self.assertEqual(symmetric.stats.nodes, 12)
@@ -0,0 +1,152 @@
+"""Test pycog.glr"""
+
+import sys
+import os.path as op
+
+# Need this so we pick up the code base for which this is a test, not an
+# installed version.
+package_dir = op.abspath(op.join('..', 'packages'))
+if package_dir not in sys.path:
+    sys.path.insert(0, package_dir)
+
+import unittest
+from io import StringIO
+
+from pycog.statemachine import state
+from pycog.pushdown import *
+from pycog.glr import GLR
+from pycog.inputtape import InputTape
+from pycog.exceptions import Backtrack
+
+class Recognizer(GLR, InputTape, PushDown):
+    """
+    Base for the test grammars: start calls S, and end accepts at the end of
+    the input.
+    """
+    def __init__(self, text):
+        super().__init__(initial='start', stream=StringIO(text))
+
+    def expect(self, symbol):
+        if self.symbol != symbol:
+            raise Backtrack()
+        self.advance()
+
+    @push_state('start', resume='end', transitions=['S'])
+    def start(self):
+        pass
+
+    @pop_state('return')
+    def return_(self):
+        pass
+
+    @state('end', accepting=True)
+    def end(self):
+        if self.symbol != '':
+            raise Backtrack()
+
+class Ambiguous(Recognizer):
+    """
+    S -> S S | a, which has a Catalan number of parses of a^n.
+    """
+    @state('S', transitions=['pair', 'a'])
+    def S(self):
+        pass
+
+    @push_state('pair', resume='second', transitions=['S'])
+    def pair(self):
+        pass
+
+    @push_state('second', resume='return', transitions=['S'])
+    def second(self):
+        pass
+
+    @state('a', transitions=['return'])
+    def a(self):
+        self.expect('a')
+
+class LeftRecursive(Recognizer):
+    """
+    S -> S b | a
+    """
+    @state('S', transitions=['left', 'a'])
+    def S(self):
+        pass
+
+    @push_state('left', resume='b', transitions=['S'])
+    def left(self):
+        pass
+
+    @state('b', transitions=['return'])
+    def b(self):
+        self.expect('b')
+
+    @state('a', transitions=['return'])
+    def a(self):
+        self.expect('a')
+
+class Palindromes(Recognizer):
+    """
+    S -> a S a | b S b | (empty), where the middle must be guessed.
+    """
+    @state('S', transitions=['a', 'b', 'return'])
+    def S(self):
+        pass
+
+    @push_state('a', resume='a_close', transitions=['S'])
+    def a(self):
+        self.expect('a')
+
+    @state('a_close', transitions=['return'])
+    def a_close(self):
+        self.expect('a')
+
+    @push_state('b', resume='b_close', transitions=['S'])
+    def b(self):
+        self.expect('b')
+
+    @state('b_close', transitions=['return'])
+    def b_close(self):
+        self.expect('b')
+
+class GLRTest(unittest.TestCase):
+    def test_ambiguous(self):
+        for n in range(1, 8):
+            self.assertTrue(Ambiguous('a'*n).run(), n)
+        for text in ["", "b", "aab", "aba"]:
+            self.assertFalse(Ambiguous(text).run(), text)
+
+    def test_polynomial(self):
+        # a^24 has over 10^12 parses, but doubling the input must cost no
+        # more than cubically more work.
+        small = Ambiguous('a'*12)
+        large = Ambiguous('a'*24)
+        self.assertTrue(small.run())
+        self.assertTrue(large.run())
+        self.assertLessEqual(large.configurations, 8*small.configurations)
+        self.assertLessEqual(large.stack_nodes, 3*small.stack_nodes)
+
+    def test_left_recursion(self):
+        for text in ["a", "ab", "abbbb"]:
+            self.assertTrue(LeftRecursive(text).run(), text)
+        for text in ["", "b", "ba", "aab"]:
+            self.assertFalse(LeftRecursive(text).run(), text)
+
+    def test_palindromes(self):
+        for text in ["", "aa", "abba", "abaaba", "bbaabbaabb"]:
+            self.assertTrue(Palindromes(text).run(), text)
+        for text in ["a", "ab", "abab", "aba", "abbaa"]:
+            self.assertFalse(Palindromes(text).run(), text)
+
+    def test_tape_released(self):
+        fsm = Palindromes("abbaabba")
+        self.assertTrue(fsm.run())
+        self.assertEqual(fsm._marks, dict())
+
+    def test_mro(self):
+        class Wrong(InputTape, PushDown, GLR):
+            pass
+        with self.assertRaises(TypeError):
+            Wrong(stream=StringIO(""))
+
+if __name__ == '__main__':
+    unittest.main()
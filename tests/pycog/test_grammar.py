@@ -0,0 +1,176 @@
+"""Test pycog.grammar"""
+
+import sys
+import os.path as op
+
+# Need this so we pick up the code base for which this is a test, not an
+# installed version.
+package_dir = op.abspath(op.join('..', 'packages'))
+if package_dir not in sys.path:
+    sys.path.insert(0, package_dir)
+
+import re
+import unittest
+from io import StringIO
+
+from pycog.grammar import *
+from pycog.statemachine import state
+from pycog.backtrack import Backtracking
+from pycog.inputtape import InputTape, IterableTape
+from pycog.exceptions import GrammarError, Backtrack
+
+# The classic expression grammar, in BNF.
+arithmetic = """
+    E  -> T E'
+    E' -> "+" T E' |
+    T  -> F T'
+    T' -> "*" F T' |
+    F  -> "(" E ")" | id
+"""
+arithmetic = arithmetic.replace("E'", "<E tail>").replace("T'", "<T tail>")
+
+# ParseSimpleExpr's expressions, in EBNF over tokens.
+simple_expr = """
+    expr ::= id [ "(" [ expr ( "," expr )* ] ")" ]
+"""
+
+def tokenize(text):
+    """Generate (kind, text) tokens, skipping white space."""
+    for match in re.finditer(r'\s*(?:(\w+)|(\S))', text):
+        if match.group(1):
+            yield ('id', match.group(1))
+        else:
+            yield (match.group(2), match.group(2))
+
+class Arithmetic(InputTape, LL1Parser):
+    grammar = arithmetic
+
+    def __init__(self, text):
+        super().__init__(stream=StringIO(text))
+
+    def terminal(self, symbol):
+        if symbol.isalpha():
+            return 'id'
+        return symbol
+
+class SimpleExpr(IterableTape, LL1Parser):
+    grammar = simple_expr
+
+    def __init__(self, text):
+        super().__init__(symbols=tokenize(text))
+
+    def terminal(self, symbol):
+        return symbol[0]
+
+    def reduce(self, nonterminal, children):
+        # (name, arguments...)
+        return (children[0][1],) + tuple(child for child in children[1:]
+                                         if type(child) is tuple and
+                                         len(child) != 2)
+
+class GrammarTest(unittest.TestCase):
+    def test_first_follow(self):
+        grammar = compile_grammar(arithmetic)
+        self.assertEqual(grammar.start, 'E')
+        self.assertEqual(grammar.terminals, {'+', '*', '(', ')', 'id'})
+        self.assertEqual(grammar.nullable, {'E tail', 'T tail'})
+        self.assertEqual(grammar.first['E'], {'(', 'id'})
+        self.assertEqual(grammar.first['T tail'], {'*'})
+        self.assertEqual(grammar.follow['E'], {')', None})
+        self.assertEqual(grammar.follow['T'], {'+', ')', None})
+        self.assertEqual(grammar.follow['F'], {'+', '*', ')', None})
+        self.assertEqual(grammar.table[('T tail', '+')], ())
+        self.assertEqual(grammar.table[('F', '(')], ('(', 'E', ')'))
+
+    def test_ebnf(self):
+        grammar = compile_grammar(simple_expr)
+        self.assertEqual(grammar.terminals, {'id', '(', ')', ','})
+        self.assertEqual(len(grammar.helpers), 3)
+        self.assertEqual(grammar.expected('expr'), ['id'])
+
+    def test_cached(self):
+        self.assertIs(compile_grammar(arithmetic), compile_grammar(arithmetic))
+        self.assertIsNot(compile_grammar(arithmetic),
+                         compile_grammar(arithmetic, 'T'))
+
+    def test_conflicts(self):
+        with self.assertRaises(GrammarError) as context:
+            Grammar('E ::= E "+" "a" | "a"')
+        self.assertIn("both predicted by 'a'", str(context.exception))
+
+        with self.assertRaises(GrammarError) as context:
+            Grammar('S ::= "a" ["b"] "b"*')
+        self.assertIn("'b'", str(context.exception))
+
+    def test_bad_grammar(self):
+        for text in ['', 'S ::= ("a"', 'S ::= "a" ]', 'S "a"', 'S ::= ""',
+                     'S ::= "a" $', 'S ::= "S"']:
+            with self.assertRaises(GrammarError, msg=text):
+                Grammar(text)
+        with self.assertRaises(GrammarError):
+            Grammar('S ::= "a"', 'T')
+
+class FalseStarts(Backtracking, InputTape, LL1Parser):
+    """
+    Arithmetic, scanning the start of each alternative on a path that is then
+    abandoned.
+    """
+    grammar = arithmetic
+
+    def __init__(self, text):
+        super().__init__(stream=StringIO(text))
+
+    terminal = Arithmetic.terminal
+
+    @state('predict', transitions=['false_start', 'scan'])
+    def predict(self):
+        LL1Parser.predict.record.activity(self)
+
+    @state('false_start')
+    def false_start(self):
+        LL1Parser.scan.record.activity(self)
+        raise Backtrack()
+
+class LL1ParserTest(unittest.TestCase):
+    def test_accept(self):
+        fsm = Arithmetic("(a+b)*c")
+        self.assertTrue(fsm.run())
+        self.assertEqual(fsm.tree[0], 'E')
+        self.assertEqual(fsm.stack_depth, 0)
+
+        for text in ["a", "a+b+c", "a*(b+c)*d", "((a))"]:
+            self.assertTrue(Arithmetic(text).run(), text)
+
+    def test_reject(self):
+        for text in ["", "a+", "(a", "a)", "ab", "+a", "a**b"]:
+            self.assertFalse(Arithmetic(text).run(), text)
+
+        fsm = Arithmetic("a+*b")
+        self.assertFalse(fsm.run())
+        self.assertEqual(fsm.error_pos, 2)
+        self.assertEqual(fsm.error_msg, "Expected '(' or 'id' at position 2, "
+                         "found '*'.")
+
+    def test_backtrack(self):
+        # Children added on the abandoned paths don't leak into the tree.
+        for text in ["(a+b)*c", "a*(b+c)*d"]:
+            expected = Arithmetic(text)
+            self.assertTrue(expected.run())
+            fsm = FalseStarts(text)
+            self.assertTrue(fsm.run(), text)
+            self.assertEqual(fsm.tree, expected.tree, text)
+
+    def test_tree(self):
+        fsm = SimpleExpr("animals(canines(dogs, wolves), felines)")
+        self.assertTrue(fsm.run())
+        self.assertEqual(fsm.tree, ('animals', ('canines', ('dogs',),
+                                                ('wolves',)),
+                                    ('felines',)))
+
+        fsm = SimpleExpr("a(b,)")
+        self.assertFalse(fsm.run())
+        self.assertEqual(fsm.error_msg, "Expected 'id' at position 4, "
+                         "found ')'.")
+
+if __name__ == '__main__':
+    unittest.main()
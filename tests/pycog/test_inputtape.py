@@ -0,0 +1,373 @@
+"""Test pycog.inputtape"""
+
+import sys
+import os
+import os.path as op
+import re
+import tempfile
+
+# Need this so we pick up the code base for which this is a test, not an
+# installed version.
+package_dir = op.abspath(op.join('..', 'packages'))
+if package_dir not in sys.path:
+    sys.path.insert(0, package_dir)
+
+import unittest
+
+from pycog.statemachine import *
+from pycog.inputtape import *
+from pycog.pushdown import *
+
+class PsAndQsRules:
+    """
+    States for (p^n)(q^m), for use with different tapes.
+
+    The p and q attributes are the symbols to match.
+    """
+    p, q = 'p', 'q'
+
+    @state('i', transitions=['p', 'q'])
+    def initial(self):
+        pass
+
+    @state('p', transitions=['p', 'q'], accepting=True)
+    def p_state(self):
+        self.advance()
+    @p_state.guard
+    def p_state(self):
+        return self.symbol == self.p
+
+    @state('q', transitions=['q'], accepting=True)
+    def q_state(self):
+        self.advance()
+    @q_state.guard
+    def q_state(self):
+        return self.symbol == self.q
+
+    def on_no_transition(self, s_name):
+        if self.accept_test():
+            raise Accept()
+        raise Reject("Unexpected character")
+
+class MmapPsAndQs(MmapInputTape, PsAndQsRules, StateMachine):
+    """(p^n)(q^m) over a memory-mapped file."""
+    def __init__(self, path, encoding=None):
+        super().__init__(initial='i', path=path, encoding=encoding)
+        if encoding == None:
+            self.p, self.q = b'p', b'q'
+
+class MmapInputTapeTest(unittest.TestCase):
+    def setUp(self):
+        self.files = []
+
+    def tearDown(self):
+        for path in self.files:
+            os.remove(path)
+
+    def make_file(self, data):
+        handle, path = tempfile.mkstemp()
+        os.write(handle, data)
+        os.close(handle)
+        self.files.append(path)
+        return path
+
+    def test_bytes(self):
+        fsm = MmapPsAndQs(self.make_file(b'pppqq'))
+        self.assertTrue(fsm.run())
+        self.assertEqual(fsm.pos, 5)
+        fsm.close()
+
+        fsm = MmapPsAndQs(self.make_file(b'ppqpq'))
+        self.assertFalse(fsm.run())
+        self.assertEqual(fsm.pos, 3)
+        fsm.close()
+
+    def test_empty(self):
+        fsm = MmapPsAndQs(self.make_file(b''))
+        self.assertTrue(fsm.run())
+        fsm.close()
+
+    def test_decoding(self):
+        path = self.make_file('ppéq'.encode('utf-8'))
+        fsm = MmapPsAndQs(path, encoding='utf-8')
+        self.assertFalse(fsm.run())
+        self.assertEqual(fsm.symbol, 'é')
+        self.assertEqual(fsm.pos, 2)
+        fsm.advance()
+        self.assertEqual(fsm.symbol, 'q')
+        self.assertEqual(fsm.pos, 4)
+        self.assertEqual(fsm.span(0, 4), 'ppé')
+
+        fsm.seek(1)
+        self.assertEqual(fsm.symbol, 'p')
+        fsm.close()
+
+class Framing(BytesTape, StateMachine):
+    """Length-prefixed frames: a length byte followed by that many bytes."""
+    def __init__(self, data):
+        super().__init__(initial='length', data=data)
+        self.frames = []
+
+    @state('length', transitions=[('body', byte_test(range(256))),
+                                  ('done', byte_test([BYTE_EOF]))])
+    def length(self):
+        pass
+
+    @state('body', transitions=['length'])
+    def body(self):
+        start = self.pos + 1
+        self.seek(start + self.symbol)
+        if self.pos > len(self.data):
+            raise Reject("Truncated frame")
+        self.frames.append(self.span(start, self.pos))
+
+    @state('done', accepting=True)
+    def done(self):
+        pass
+
+class BytesTapeTest(unittest.TestCase):
+    def test_frames(self):
+        fsm = Framing(bytearray(b'\x02ab\x00\x03xyz'))
+        self.assertTrue(fsm.run())
+        self.assertEqual([bytes(f) for f in fsm.frames], [b'ab', b'', b'xyz'])
+        self.assertIsInstance(fsm.frames[0], memoryview)
+
+    def test_truncated(self):
+        fsm = Framing(b'\x02ab\x05xyz')
+        self.assertFalse(fsm.run())
+
+    def test_table(self):
+        table = byte_table(b'()', value='paren', default=None)
+        self.assertEqual(len(table), BYTE_EOF + 1)
+        self.assertEqual(table[ord('(')], 'paren')
+        self.assertIsNone(table[BYTE_EOF])
+
+class FeedPsAndQs(FeedTape, PsAndQsRules, StateMachine):
+    """(p^n)(q^m) fed incrementally."""
+    def __init__(self):
+        super().__init__(initial='i')
+
+class FeedParens(FeedTape, PushDown):
+    """
+    Matching parentheses fed incrementally.
+
+    The transitions out of the push state look at the input, so they may run
+    out of input after the push.
+    """
+    def __init__(self):
+        super().__init__(initial='scan')
+
+    @state('scan', transitions=['(', ')', 'end'])
+    def scan(self):
+        pass
+
+    @push_state('(', resume='scan', transitions=['(', ')'])
+    def open_paren(self):
+        self.advance()
+    @open_paren.guard
+    def open_paren(self):
+        return self.symbol == '('
+
+    @pop_state(')')
+    def close_paren(self):
+        self.advance()
+        if self.stack_empty:
+            raise Reject("Unmatched ')'")
+    @close_paren.guard
+    def close_paren(self):
+        return self.symbol == ')'
+
+    @state('end', accepting=True)
+    def end(self):
+        raise Accept()
+    @end.guard
+    def end(self):
+        return self.symbol == self.eof and self.stack_empty
+
+class FeedCounter(FeedTape, StateMachine):
+    """Count p's, with a side effect before each advance()."""
+    def __init__(self):
+        super().__init__(initial='p')
+        self.n = 0
+
+    @state('p', transitions=['p', 'end'])
+    def p(self):
+        self.n += 1
+        self.advance()
+    @p.guard
+    def p(self):
+        return self.symbol == 'p'
+
+    @state('end', accepting=True)
+    def end(self):
+        raise Accept()
+    @end.guard
+    def end(self):
+        return self.symbol == self.eof
+
+class FeedPairs(FeedTape, StateMachine):
+    """(ab)*, reading each b as it's advanced to."""
+    def __init__(self):
+        super().__init__(initial='pair')
+        self.n = 0
+
+    @state('pair', transitions=['pair', 'end'])
+    def pair(self):
+        if self.symbol != 'a' or self.advance() != 'b':
+            raise Reject()
+        self.advance()
+        self.n += 1
+    @pair.guard
+    def pair(self):
+        return self.symbol == 'a'
+
+    @state('end', accepting=True)
+    def end(self):
+        raise Accept()
+    @end.guard
+    def end(self):
+        return self.symbol == self.eof
+
+class FeedExits(FeedTape, StateMachine):
+    """Count exits from a final state that looks at the input."""
+    def __init__(self):
+        super().__init__(initial='start')
+        self.exits = 0
+
+    @state('start', transitions=['done'])
+    def start(self):
+        self.advance()
+
+    @state('done')
+    def done(self):
+        pass
+
+    def on_exit_state(self, s_name):
+        if s_name == 'done':
+            self.exits += 1
+        super().on_exit_state(s_name)
+
+    def on_no_transition(self, s_name):
+        if self.accept_test():
+            raise Accept()
+        raise Reject()
+
+class FeedTapeTest(unittest.TestCase):
+    def test_chunks(self):
+        fsm = FeedPsAndQs()
+        self.assertIsNone(fsm.feed('pp'))
+        self.assertIsNone(fsm.feed('pq'))
+        self.assertIsNone(fsm.feed(''))
+        self.assertIsNone(fsm.feed('qq'))
+        self.assertTrue(fsm.close())
+        self.assertEqual(fsm.pos, 6)
+
+    def test_reject_early(self):
+        fsm = FeedPsAndQs()
+        self.assertIsNone(fsm.feed('ppq'))
+        self.assertFalse(fsm.feed('qpq'))
+        self.assertEqual(fsm.pos, 4)
+
+    def test_discard(self):
+        fsm = FeedPsAndQs()
+        for i in range(100):
+            fsm.feed('p')
+        self.assertLessEqual(len(fsm._chunks), 1)
+        self.assertTrue(fsm.close())
+
+    def test_side_effects(self):
+        for chunks in [['p', 'p', 'p'], ['ppp'], ['pp', 'p']]:
+            fsm = FeedCounter()
+            for chunk in chunks:
+                self.assertIsNone(fsm.feed(chunk))
+            self.assertTrue(fsm.close())
+            self.assertEqual(fsm.n, 3, chunks)
+
+    def test_advance(self):
+        for chunks in [['a', 'b', 'a', 'b'], ['abab'], ['aba', 'b']]:
+            fsm = FeedPairs()
+            for chunk in chunks:
+                self.assertIsNone(fsm.feed(chunk))
+            self.assertTrue(fsm.close())
+            self.assertEqual(fsm.n, 2, chunks)
+        fsm = FeedPairs()
+        self.assertIsNone(fsm.feed('a'))
+        self.assertFalse(fsm.feed('c'))
+
+    def test_exit_once(self):
+        # Exited on transitioning and on accepting, as with run(), however
+        # the input is fed.
+        fsm = FeedExits()
+        self.assertIsNone(fsm.feed('x'))
+        self.assertTrue(fsm.close())
+        self.assertEqual(fsm.exits, 2)
+
+    def test_pushdown(self):
+        for text, expected in [('(()())', True), ('(()', False),
+                               ('())', False), ('', True)]:
+            fsm = FeedParens()
+            for char in text:
+                self.assertIsNone(fsm.result)
+                fsm.feed(char)
+            self.assertEqual(fsm.close(), expected, text)
+
+def lex(text, log):
+    """Lexer for TokenSum, logging each token produced."""
+    for match in re.finditer(r'\s*(?:(\d+)|(\S))', text):
+        if match.group(1):
+            token = ('num', int(match.group(1)))
+        else:
+            token = ('op', match.group(2))
+        log.append(token)
+        yield token
+
+class TokenSum(IterableTape, StateMachine):
+    """Add up numbers in a token stream like 1 + 2 + 3."""
+    def __init__(self, tokens, log):
+        super().__init__(initial='num', symbols=tokens)
+        self.total = 0
+        self.log = log
+        self.max_lookahead = 0
+
+    @state('num', transitions=['plus', 'end'])
+    def num(self):
+        if self.symbol == self.eof or self.symbol[0] != 'num':
+            raise Reject("Expected a number")
+        self.total += self.symbol[1]
+        self.advance()
+        self.max_lookahead = max(self.max_lookahead,
+                                 len(self.log) - self.pos)
+
+    @state('plus', transitions=['num'])
+    def plus(self):
+        self.advance()
+    @plus.guard
+    def plus(self):
+        return self.symbol == ('op', '+')
+
+    @state('end', accepting=True)
+    def end(self):
+        raise Accept()
+    @end.guard
+    def end(self):
+        return self.symbol == self.eof
+
+class IterableTapeTest(unittest.TestCase):
+    def test_tokens(self):
+        log = []
+        fsm = TokenSum(lex("1 + 22 + 333", log), log)
+        self.assertTrue(fsm.run())
+        self.assertEqual(fsm.total, 356)
+        self.assertEqual(fsm.max_lookahead, 1)
+
+    def test_bad_tokens(self):
+        log = []
+        fsm = TokenSum(lex("1 + + 2", log), log)
+        self.assertFalse(fsm.run())
+        self.assertEqual(fsm.pos, 2)
+        self.assertEqual(len(log), 3)
+
+    def test_string(self):
+        tape = IterableTape(symbols="ab", eof='')
+        self.assertEqual([tape.symbol, tape.advance(), tape.advance()],
+                         ['a', 'b', ''])
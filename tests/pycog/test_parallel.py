@@ -0,0 +1,119 @@
+"""Test pycog.parallel"""
+
+import sys
+import os.path as op
+
+# Need this so we pick up the code base for which this is a test, not an
+# installed version.
+package_dir = op.abspath(op.join('..', 'packages'))
+if package_dir not in sys.path:
+    sys.path.insert(0, package_dir)
+
+example_dir = op.abspath(op.join('..', 'examples'))
+if example_dir not in sys.path:
+    sys.path.insert(0, example_dir)
+
+import unittest
+import multiprocessing
+from functools import partial
+
+from pycog.statemachine import state
+from pycog.exceptions import Accept
+from pycog.parallel import *
+from pycog import parallel
+
+from eight_queens import EightQueens
+from min_change import MinimalChange
+
+class ChangeSolutions(MinimalChange):
+    """MinimalChange, accepting every way of making change."""
+    @state('final')
+    def final(self):
+        raise Accept()
+
+    def solution(self):
+        return sorted(coin for coin, count in self.coins.items()
+                      for i in range(count))
+
+class SharedChange(SharedBound, MinimalChange):
+    """MinimalChange, sharing its bound with the other workers."""
+    def __init__(self, amount, coin_values):
+        self.backtracked = 0
+        super().__init__(amount=amount, coin_values=coin_values)
+
+    def on_backtrack(self, occ):
+        self.backtracked += 1
+        super().on_backtrack(occ)
+
+class SharedChangeSolutions(SharedBound, ChangeSolutions):
+    """ChangeSolutions, sharing its bound with the other workers."""
+    def __init__(self, amount, coin_values):
+        super().__init__(amount=amount, coin_values=coin_values)
+
+class ParallelTest(unittest.TestCase):
+    def is_solution(self, queens):
+        rows = set(row for row, col in queens)
+        diagonals = set(row - col for row, col in queens)
+        anti_diagonals = set(row + col for row, col in queens)
+        return len(rows) == len(diagonals) == len(anti_diagonals) == 8
+
+    def test_split(self):
+        prefixes, solutions = split(EightQueens(), 1)
+        self.assertEqual(prefixes, [('init', (row, 0)) for row in range(4)])
+        self.assertEqual(solutions, [])
+
+    def test_split_memoized(self):
+        # Prefixes set aside by split() don't prune later equal ones.
+        memoized = ChangeSolutions(19, [1, 3, 5, 7, 11, 13])
+        unmemoized = ChangeSolutions(19, [1, 3, 5, 7, 11, 13])
+        unmemoized.signature = lambda: None
+        self.assertEqual(split(memoized, 3), split(unmemoized, 3))
+
+    def test_first(self):
+        path = parallel_search(EightQueens, mode='first', processes=2)
+        self.assertTrue(self.is_solution(path[1:-1]))
+
+    def test_first_branch_and_bound(self):
+        factory = partial(SharedChange, 35, [1, 3, 5, 7, 11, 13])
+        coins = parallel_search(factory, mode='first', processes=2)
+        self.assertEqual(sum(value*count for value, count in coins.items()),
+                         35)
+
+    def test_adopted_bound(self):
+        # A bound from another worker is not a solution of this one.
+        fsm = MinimalChange(35, [1, 3, 5, 7, 11, 13])
+        fsm.incumbent_value = 1
+        self.assertFalse(fsm.run())
+        self.assertIsNone(fsm.incumbent)
+
+    def test_shared_bound(self):
+        # As in a worker, whose subclass hooks still run.
+        parallel._init_worker(multiprocessing.Value('d', 2.0))
+        try:
+            fsm = SharedChange(35, [1, 3, 5, 7, 11, 13])
+            self.assertEqual(fsm.incumbent_value, 2)
+            self.assertFalse(fsm.run())
+            self.assertGreater(fsm.backtracked, 0)
+
+            fsm = SharedChange(35, [5, 7, 11, 13])
+            fsm.incumbent_value = 1
+            fsm.on_backtrack(None)
+            self.assertEqual(parallel._shared_bound.value, 1)
+        finally:
+            parallel._init_worker(None)
+
+        with self.assertRaises(TypeError):
+            type('Wrong', (MinimalChange, SharedBound), {})(35, [1])
+
+    def test_all(self):
+        paths = parallel_search(EightQueens, depth=2, mode='all', processes=2)
+        # Only half the solutions, by symmetry.
+        self.assertEqual(len(paths), 46)
+        self.assertEqual(len(set(paths)), 46)
+        for path in paths:
+            self.assertTrue(self.is_solution(path[1:-1]))
+
+    def test_best(self):
+        factory = partial(SharedChangeSolutions, 35, [1, 3, 5, 7, 11, 13])
+        best = parallel_search(factory, mode='best', key=len, processes=2)
+        self.assertEqual(best, [11, 11, 13])
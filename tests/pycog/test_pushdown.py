@@ -16,8 +16,223 @@ if example_dir not in sys.path:
 import unittest
 from io import StringIO
 
+from pycog.statemachine import state
+from pycog.pushdown import *
+from pycog.backtrack import Backtracking
+from pycog.inputtape import InputTape
+from pycog.exceptions import Backtrack, Reject, StackOverflow
+
 from check_parens import ParenChecker
 
+class Palindromes(Backtracking, InputTape, PushDown):
+    """
+    Recognize even length palindromes over a and b.
+
+    The grammar S -> a S a | b S b | (empty) is recognized by guessing which
+    alternative to take, so the middle of the input is only found by
+    backtracking.
+    """
+    def __init__(self, stream):
+        super().__init__(initial='start', stream=stream)
+
+    def expect(self, symbol):
+        if self.symbol != symbol:
+            raise Backtrack()
+        self.advance()
+
+    @push_state('start', resume='end', transitions=['S'])
+    def start(self):
+        pass
+
+    @state('S', transitions=['a', 'b', 'empty'])
+    def S(self):
+        pass
+
+    @push_state('a', resume='a_close', transitions=['S'])
+    def a(self):
+        self.expect('a')
+
+    @state('a_close', transitions=['return'])
+    def a_close(self):
+        self.expect('a')
+
+    @push_state('b', resume='b_close', transitions=['S'])
+    def b(self):
+        self.expect('b')
+
+    @state('b_close', transitions=['return'])
+    def b_close(self):
+        self.expect('b')
+
+    @state('empty', transitions=['return'])
+    def empty(self):
+        pass
+
+    @pop_state('return')
+    def return_(self):
+        pass
+
+    @state('end', accepting=True)
+    def end(self):
+        if self.symbol != '':
+            raise Backtrack()
+
+class Sums(Backtracking, InputTape, PushDown):
+    """
+    Recognize E -> T '+' E | T, T -> '(' E ')' | 'a'.
+
+    The alternatives of E share the push state T, and are tried in order, so
+    without packrat memoization T is parsed again whenever there is no '+',
+    which takes exponential time in the nesting depth.
+
+    The frames return the nesting depth of the last T.
+    """
+    def __init__(self, stream, packrat_size=0):
+        super().__init__(initial='start', stream=stream)
+        self.packrat_size = packrat_size
+
+    def expect(self, symbol):
+        if self.symbol != symbol:
+            raise Backtrack()
+        self.advance()
+
+    @push_state('start', resume='end', transitions=['E'])
+    def start(self):
+        pass
+
+    @state('E', transitions=['sum', 'single'])
+    def E(self):
+        pass
+
+    @state('sum', transitions=['T'])
+    def sum(self):
+        self.active_frame.alt = 'sum'
+
+    @state('single', transitions=['T'])
+    def single(self):
+        self.active_frame.alt = 'single'
+
+    @push_state('T', resume='T_done', transitions=['paren', 'a'])
+    def T(self):
+        pass
+
+    @push_state('paren', resume='close', transitions=['E'])
+    def paren(self):
+        self.expect('(')
+
+    @state('close', transitions=['return'])
+    def close(self):
+        self.expect(')')
+        self.active_frame.depth = self.returned_frame.depth + 1
+
+    @state('a', transitions=['return'])
+    def a(self):
+        self.expect('a')
+        self.active_frame.depth = 0
+
+    @state('T_done', transitions=[
+        ('plus', lambda fsm, s, t: fsm.active_frame.alt == 'sum'),
+        ('return', lambda fsm, s, t: fsm.active_frame.alt == 'single')])
+    def T_done(self):
+        self.active_frame.depth = self.returned_frame.depth
+
+    @state('plus', transitions=['E'])
+    def plus(self):
+        self.expect('+')
+
+    @pop_state('return')
+    def return_(self):
+        pass
+
+    @state('end', accepting=True)
+    def end(self):
+        if self.symbol != '':
+            raise Backtrack()
+
+class PackratTest(unittest.TestCase):
+    def test_accept(self):
+        for packrat_size in [0, 1, -1]:
+            for text, depth in [("a", 0), ("a+a", 0), ("((a))", 2),
+                                ("(a+(a))+((a))", 2), ("a+(a+(a))", 2)]:
+                fsm = Sums(StringIO(text), packrat_size)
+                self.assertTrue(fsm.run(), text)
+                self.assertEqual(fsm.returned_frame.depth, depth, text)
+
+    def test_reject(self):
+        for packrat_size in [0, 1, -1]:
+            for text in ["", "a+", "(a", "a)", "(a+)", "((a)"]:
+                fsm = Sums(StringIO(text), packrat_size)
+                self.assertFalse(fsm.run(), text)
+
+    def test_linear(self):
+        text = "("*8 + "a" + ")"*8
+        plain = Sums(StringIO(text))
+        packrat = Sums(StringIO(text), -1)
+        self.assertTrue(plain.run())
+        self.assertTrue(packrat.run())
+        self.assertGreater(plain.stats.nodes, 1000)
+        self.assertLess(packrat.stats.nodes, 200)
+
+    def test_eviction(self):
+        fsm = Sums(StringIO("(((a)))+a"), 2)
+        self.assertTrue(fsm.run())
+        self.assertLessEqual(len(fsm._packrat), 2)
+
+class BacktrackingPushDownTest(unittest.TestCase):
+    def test_accept(self):
+        for text in ["", "aa", "abba", "abaaba", "bbaabbaabb"]:
+            fsm = Palindromes(StringIO(text))
+            self.assertTrue(fsm.run(), text)
+            self.assertTrue(fsm.stack_empty)
+            self.assertEqual(fsm.current_state, 'end')
+
+    def test_reject(self):
+        for text in ["a", "ab", "abab", "aba", "abbaa"]:
+            fsm = Palindromes(StringIO(text))
+            self.assertFalse(fsm.run(), text)
+            self.assertTrue(fsm.stack_empty)
+
+    def test_stack(self):
+        fsm = Palindromes(StringIO("abba"))
+        self.assertEqual(fsm.stack_snapshot(), ())
+        fsm.active_frame.tag = 'bottom'
+        mark = fsm.mark_stack()
+        fsm._push()
+        fsm._push()
+        self.assertEqual(fsm.stack_depth, 2)
+        self.assertEqual(fsm.stack_snapshot()[0].tag, 'bottom')
+        with self.assertRaises(AttributeError):
+            fsm.stack_snapshot().append(fsm.active_frame)
+
+        fsm.reset_stack(mark)
+        self.assertTrue(fsm.stack_empty)
+        self.assertEqual(fsm.active_frame.tag, 'bottom')
+
+    def test_copy_on_write(self):
+        fsm = Palindromes(StringIO(""))
+        fsm.active_frame.tag = 'bottom'
+        fsm._push()
+        fsm.active_frame.tag = 'middle'
+
+        snapshot = fsm.mark_stack()
+        fsm.active_frame.tag = 'changed'
+        fsm._push()
+        fsm.active_frame.tag = 'top'
+
+        fsm.reset_stack(snapshot)
+        self.assertEqual(fsm.stack_depth, 1)
+        self.assertEqual(fsm.top_frame.tag, 'bottom')
+        self.assertEqual(fsm.active_frame.tag, 'middle')
+
+        # Each restore is an independent fork.
+        fsm.active_frame.tag = 'fork'
+        fsm.reset_stack(snapshot)
+        self.assertEqual(fsm.active_frame.tag, 'middle')
+
+        # Frames are only copied once per snapshot.
+        frame = fsm.active_frame
+        self.assertIs(fsm.active_frame, frame)
+
 class CheckParensTest(unittest.TestCase):
     def test_1(self):
         test = ParenChecker(StringIO("( )"))
@@ -55,6 +270,71 @@ class CheckParensTest(unittest.TestCase):
         test = ParenChecker(StringIO("(([] { () })"))
         self.assertFalse(test.run())
 
+class FramePoolTest(unittest.TestCase):
+    def test_slotted(self):
+        fsm = ParenChecker(StringIO("(([] {}) ())"))
+        self.assertTrue(fsm.run())
+        self.assertFalse(hasattr(fsm.active_frame, '__dict__'))
+        self.assertIs(type(fsm.active_frame),
+                      type(ParenChecker(StringIO("")).active_frame))
+
+    def test_reuse(self):
+        fsm = ParenChecker(StringIO("(((()))) (((()))) (((())))"))
+        self.assertTrue(fsm.run())
+
+        # The deepest nesting is 4, so 4 frames are enough for all 12 pushes.
+        self.assertEqual(len(fsm._free_frames), 4)
+
+        pooled = fsm._free_frames[-1]
+        self.assertEqual(pooled.state, ')')
+        fsm._push()
+        self.assertIs(fsm.active_frame, pooled)
+        self.assertEqual(fsm.active_frame.state, None)
+        self.assertEqual(fsm.active_frame.pos, -1)
+
+class StackLimitTest(unittest.TestCase):
+    def test_overflow(self):
+        fsm = ParenChecker(StringIO("("*100000))
+        fsm.max_depth = 1000
+        self.assertFalse(fsm.run())
+        self.assertEqual(fsm.stack_depth, 1000)
+        self.assertEqual(fsm.stack_stats.peak_depth, 1000)
+        self.assertEqual(fsm.stack_stats.overflows, 1)
+
+        # The input was abandoned at the overflow.
+        self.assertEqual(fsm.pos, 1001)
+
+        with self.assertRaises(StackOverflow):
+            fsm._push()
+
+        self.assertTrue(issubclass(StackOverflow, Reject))
+
+    def test_stats(self):
+        fsm = ParenChecker(StringIO("(([] {}) ())"))
+        self.assertTrue(fsm.run())
+        stats = fsm.stack_stats
+        self.assertEqual(stats.depth, 0)
+        self.assertEqual(stats.peak_depth, 3)
+        self.assertEqual(stats.frame_bytes, 0)
+        self.assertGreater(stats.peak_bytes, 0)
+        self.assertEqual(stats.overflows, 0)
+        self.assertIn('peak 3', str(stats))
+
+    def test_snapshot(self):
+        fsm = Palindromes(StringIO(""))
+        mark = fsm.mark_stack()
+        fsm._push()
+        fsm._push()
+        stats = fsm.stack_stats
+        self.assertEqual(stats.depth, 2)
+        two_frames = stats.frame_bytes
+
+        fsm.reset_stack(mark)
+        self.assertEqual(stats.sample(), {'depth': 0, 'peak_depth': 2,
+                                          'frame_bytes': 0,
+                                          'peak_bytes': two_frames,
+                                          'overflows': 0})
+
 from simple_expression import ParseSimpleExpr
 from pycog.graph import Graph, is_tree
 
@@ -73,4 +353,3 @@ class SimpleExprParseTest(unittest.TestCase):
         parser.run()
         self.assertEqual(str(is_tree(tree)), 'animals')
         self.assertEqual(tree.num_vertices(), 15)
-
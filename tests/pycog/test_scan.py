@@ -0,0 +1,81 @@
+"""Test pycog.scan"""
+
+import sys
+import os.path as op
+
+# Need this so we pick up the code base for which this is a test, not an
+# installed version.
+package_dir = op.abspath(op.join('..', 'packages'))
+if package_dir not in sys.path:
+    sys.path.insert(0, package_dir)
+
+import unittest
+from io import StringIO
+
+from pycog.statemachine import *
+from pycog.exceptions import *
+from pycog.inputtape import *
+from pycog.scan import *
+
+class CountingStream(StringIO):
+    """StringIO that counts the characters read from it."""
+    def __init__(self, text):
+        super().__init__(text)
+        self.reads = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.reads += len(data)
+        return data
+
+class ABs(Scanning, InputTape, StateMachine):
+    """Find a b+ and a b+ c."""
+    def __init__(self, stream):
+        super().__init__(initial='start', stream=stream)
+        self.attempts = 0
+
+    def on_scan_start(self, pos):
+        super().on_scan_start(pos)
+        self.attempts += 1
+
+    @state('start', transitions=['a'])
+    def start(self):
+        pass
+
+    @state('a', transitions=['b'])
+    def a(self):
+        self.advance()
+    @a.guard
+    def a(self):
+        return self.symbol == 'a'
+
+    @state('b', transitions=['b', 'c'], accepting=True)
+    def b(self):
+        self.advance()
+    @b.guard
+    def b(self):
+        return self.symbol == 'b'
+
+    @state('c')
+    def c(self):
+        self.advance()
+        raise Accept()
+    @c.guard
+    def c(self):
+        return self.symbol == 'c'
+
+class ScanningTest(unittest.TestCase):
+    def test_finditer(self):
+        text = "xabbbyaabcaazab"
+        stream = CountingStream(text)
+        scanner = ABs(stream)
+        matches = list(scanner.finditer())
+        self.assertEqual(matches, [(1, 5, 'b'), (7, 10, 'c'), (13, 15, 'b')])
+        self.assertEqual(stream.reads, len(text))
+        self.assertEqual(scanner.attempts, 10)
+
+    def test_no_match(self):
+        scanner = ABs(StringIO("aaa"))
+        self.assertEqual(list(scanner.finditer()), [])
+        scanner = ABs(StringIO(""))
+        self.assertEqual(list(scanner.finditer()), [])
@@ -0,0 +1,168 @@
+"""Test pycog.search"""
+
+import sys
+import os.path as op
+
+# Need this so we pick up the code base for which this is a test, not an
+# installed version.
+package_dir = op.abspath(op.join('..', 'packages'))
+if package_dir not in sys.path:
+    sys.path.insert(0, package_dir)
+
+example_dir = op.abspath(op.join('..', 'examples'))
+if example_dir not in sys.path:
+    sys.path.insert(0, example_dir)
+
+import unittest
+import itertools
+
+from pycog.statemachine import *
+from pycog.exceptions import *
+from pycog.backtrack import Backtracking
+from pycog.search import *
+
+from eight_queens import EightQueens
+
+class BestChange(BestFirst, StateMachine):
+    """Fewest coins making up an amount, by A* search."""
+    snapshot_attrs = ('remaining', 'coins')
+
+    def __init__(self, amount, coin_values, **kw_args):
+        super().__init__(**kw_args)
+
+        self.remaining = amount
+        self.coins = []
+        self.largest = max(coin_values)
+        self.expanded = 0
+
+        def fits(fsm, current_state, next_state):
+            return next_state <= fsm.remaining
+
+        def done(fsm, current_state, next_state):
+            return fsm.remaining == 0
+
+        # Coins are taken in decreasing order.  Transitions are added to init,
+        # so it needs a record of its own rather than a shared @state one.
+        self.add_state('init')
+        self.set_initial_state('init')
+        for value in coin_values:
+            self.add_state(value, activity=BestChange.add_coin)
+        for value in coin_values:
+            self.add_transition('init', value, fits)
+            self.add_transition(value, 'done', done)
+            for next_value in coin_values:
+                if next_value <= value:
+                    self.add_transition(value, next_value, fits)
+
+    def add_coin(self):
+        self.expanded += 1
+        self.remaining -= self.current_state
+        self.coins.append(self.current_state)
+
+    def cost(self):
+        return len(self.coins)
+
+    def heuristic(self):
+        return -(-self.remaining // self.largest)
+
+    @state('done')
+    def done(self):
+        raise Accept()
+
+class BestFirstTest(unittest.TestCase):
+    def test_astar(self):
+        fsm = BestChange(35, [1, 3, 5, 7, 11, 13])
+        self.assertTrue(fsm.run())
+        self.assertEqual(sorted(fsm.coins), [11, 11, 13])
+        self.assertLess(fsm.expanded, 100)
+
+    def test_beam(self):
+        fsm = BestChange(35, [1, 3, 5, 7, 11, 13], beam_width=1)
+        self.assertTrue(fsm.run())
+        self.assertEqual(sum(fsm.coins), 35)
+
+    def test_exhausted(self):
+        fsm = BestChange(7, [2, 4])
+        self.assertFalse(fsm.run())
+
+class RandomQueens(RandomRestarts, EightQueens):
+    """EightQueens in random order, with restarts."""
+    pass
+
+class BinaryTree(LimitedDiscrepancy, Backtracking, StateMachine):
+    """
+    Search a complete binary tree for a goal leaf.
+
+    States other than 'root' are strings of 0s and 1s, the path from the
+    root.  Taking a 1 is a discrepancy, since 0 is always the first candidate.
+    """
+    def __init__(self, depth, goal, **kw_args):
+        super().__init__(**kw_args)
+        self.add_state('root')
+        self.set_initial_state('root')
+
+        def add_children(s_name, path):
+            for bit in '01':
+                child = path + bit
+                self.add_state(child, accepting=(child == goal))
+                self.add_transition(s_name, child)
+                if len(child) < depth:
+                    add_children(child, child)
+        add_children('root', '')
+
+class ScheduleTest(unittest.TestCase):
+    def test_luby(self):
+        self.assertEqual([luby(i) for i in range(1, 16)],
+                         [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8])
+        self.assertEqual(list(itertools.islice(luby_schedule(3), 4)),
+                         [3, 3, 6, 3])
+
+    def test_geometric(self):
+        self.assertEqual(list(itertools.islice(geometric_schedule(10, 2), 4)),
+                         [10, 20, 40, 80])
+
+class RandomRestartsTest(unittest.TestCase):
+    def test_seed(self):
+        # Whatever the seed, a solution is found, and the same seed repeats
+        # the same search.
+        restarts = 0
+        for seed in range(8):
+            first = RandomQueens(seed=seed, schedule=luby_schedule(2))
+            self.assertTrue(first.run(), seed)
+            queens = set(first.queens)
+            self.assertEqual(len(queens), 8, seed)
+            for f in [lambda q: q[0], lambda q: q[1],
+                      lambda q: q[0] + q[1], lambda q: q[0] - q[1]]:
+                self.assertEqual(len(set(map(f, queens))), 8, seed)
+            restarts += first.restarts
+
+            second = RandomQueens(seed=seed, schedule=luby_schedule(2))
+            self.assertTrue(second.run(), seed)
+            self.assertEqual(set(second.queens), queens, seed)
+            self.assertEqual(second.restarts, first.restarts, seed)
+        self.assertGreater(restarts, 0)
+
+    def test_order(self):
+        first_rows = set()
+        for seed in range(8):
+            fsm = RandomQueens(seed=seed)
+            fsm.run()
+            first_rows.add(min(fsm.queens, key=lambda square: square[1]))
+        self.assertGreater(len(first_rows), 1)
+
+class LimitedDiscrepancyTest(unittest.TestCase):
+    def test_goal(self):
+        fsm = BinaryTree(4, '0110')
+        self.assertTrue(fsm.run())
+        self.assertEqual(fsm.current_state, '0110')
+        self.assertEqual(fsm.discrepancy_limit, 2)
+
+    def test_max_discrepancies(self):
+        fsm = BinaryTree(4, '0111', max_discrepancies=2)
+        self.assertFalse(fsm.run())
+        self.assertTrue(BinaryTree(4, '0111', max_discrepancies=3).run())
+
+    def test_exhausted(self):
+        fsm = BinaryTree(3, 'none')
+        self.assertFalse(fsm.run())
+        self.assertEqual(fsm.discrepancy_limit, 3)